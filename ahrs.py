@@ -0,0 +1,258 @@
+'''
+ahrs.py - Madgwick orientation filter for the MPU9250.
+
+Fuses gyro, accelerometer and magnetometer samples into a quaternion, so
+the heading follows the gyro while the wrist moves and is pulled towards
+the accelerometer and magnetometer at a rate set by beta (rad/s). The
+state lives in a preallocated array('f') and every update runs the same
+fixed sequence of float operations, about 0.3k, whatever the input.
+
+    >>> f = ahrs.Madgwick()
+    >>> f.align(sensor)
+    >>> f.feed(sensor)  # Once per frame.
+    >>> f.heading
+    >>> bench.timed(lambda: f.update(0.01, 0, 0, 0, 0, 0, 9.8, 20, 0, -40))
+
+Axes are those of the MPU6500. The AK8963 inside the MPU9250 has X and Y
+swapped and Z inverted, feed() turns its samples around, pass them to
+update() already turned.
+
+HeadingTracker is the cheap alternative when only the heading matters:
+the gyro rate about gravity carries the heading from one magnetometer
+sample to the next, and each new sample pulls it back by a fixed share
+of the difference. The magnetometer can stay in its 8Hz mode while the
+heading is read at the frame rate.
+'''
+from array import array
+from math import atan2, asin, cos, degrees, sin
+from utime import sleep_ms, ticks_us, ticks_diff
+
+
+def _inv_sqrt(value):
+    return value ** -0.5 if value > 0 else 0.0
+
+
+class Madgwick:
+    def __init__(self, beta=0.1):
+        self.beta = beta
+        self.q = array('f', (1.0, 0.0, 0.0, 0.0))
+        self._last = None
+
+    def reset(self):
+        q = self.q
+        q[0], q[1], q[2], q[3] = 1.0, 0.0, 0.0, 0.0
+        self._last = None
+
+    def align(self, sensor):
+        """Set the orientation from one accelerometer and magnetometer
+        sample of an mpu9250.MPU9250 at once instead of at beta, for a new
+        screen which should not show the filter settling. Waits up to
+        0.3s for a new magnetometer sample.
+        """
+        ak = sensor.ak8963
+        mx, my, mz = ak.magnetic
+        wait = 30
+        while not ak.fresh and wait:
+            sleep_ms(10)
+            mx, my, mz = ak.magnetic
+            wait -= 1
+        mx, my, mz = my, mx, -mz
+        ax, ay, az = sensor.mpu6500.acceleration
+        # Roll and pitch from gravity, yaw from the field turned level.
+        roll = atan2(ay, az)
+        pitch = atan2(-ax, (ay * ay + az * az) ** 0.5)
+        cr, sr = cos(roll), sin(roll)
+        cp, sp = cos(pitch), sin(pitch)
+        yaw = -atan2(my * cr - mz * sr, mx * cp + (my * sr + mz * cr) * sp)
+        cr, sr = cos(roll / 2), sin(roll / 2)
+        cp, sp = cos(pitch / 2), sin(pitch / 2)
+        cy, sy = cos(yaw / 2), sin(yaw / 2)
+        q = self.q
+        q[0] = cr * cp * cy + sr * sp * sy
+        q[1] = sr * cp * cy - cr * sp * sy
+        q[2] = cr * sp * cy + sr * cp * sy
+        q[3] = cr * cp * sy - sr * sp * cy
+        self._last = None
+
+    def feed(self, sensor, now=None):
+        """Update from an mpu9250.MPU9250, timed by ticks_us() or now.
+        The magnetometer only corrects when it has a new sample, see
+        AK8963.fresh.
+        """
+        if now is None:
+            now = ticks_us()
+        (ax, ay, az), (gx, gy, gz), temp = sensor.mpu6500.motion
+        mx, my, mz = sensor.ak8963.magnetic
+        if not sensor.ak8963.fresh:
+            mx = my = mz = 0.0
+        if self._last is not None:
+            dt = ticks_diff(now, self._last) / 1000000
+            self.update(dt, gx, gy, gz, ax, ay, az, my, mx, -mz)
+        self._last = now
+
+    def update(self, dt, gx, gy, gz, ax, ay, az, mx=0.0, my=0.0, mz=0.0):
+        """Advance by dt seconds. Gyro in rad/s, accelerometer and
+        magnetometer in any unit. A zero magnetometer sample (or a zero
+        accelerometer one) leaves that correction out.
+        """
+        q = self.q
+        q0, q1, q2, q3 = q[0], q[1], q[2], q[3]
+
+        # Rate of change from the gyro
+        qd0 = 0.5 * (-q1 * gx - q2 * gy - q3 * gz)
+        qd1 = 0.5 * (q0 * gx + q2 * gz - q3 * gy)
+        qd2 = 0.5 * (q0 * gy - q1 * gz + q3 * gx)
+        qd3 = 0.5 * (q0 * gz + q1 * gy - q2 * gx)
+
+        if ax or ay or az:
+            n = _inv_sqrt(ax * ax + ay * ay + az * az)
+            ax *= n
+            ay *= n
+            az *= n
+            _2q0 = 2 * q0
+            _2q1 = 2 * q1
+            _2q2 = 2 * q2
+            _2q3 = 2 * q3
+            if mx or my or mz:
+                n = _inv_sqrt(mx * mx + my * my + mz * mz)
+                mx *= n
+                my *= n
+                mz *= n
+                q0q0 = q0 * q0
+                q0q1 = q0 * q1
+                q0q2 = q0 * q2
+                q0q3 = q0 * q3
+                q1q1 = q1 * q1
+                q1q2 = q1 * q2
+                q1q3 = q1 * q3
+                q2q2 = q2 * q2
+                q2q3 = q2 * q3
+                q3q3 = q3 * q3
+
+                # Earth magnetic field direction
+                hx = (mx * (q0q0 + q1q1 - q2q2 - q3q3) + 2 * my * (q1q2 - q0q3)
+                      + 2 * mz * (q1q3 + q0q2))
+                hy = (2 * mx * (q1q2 + q0q3) + my * (q0q0 - q1q1 + q2q2 - q3q3)
+                      + 2 * mz * (q2q3 - q0q1))
+                _2bx = (hx * hx + hy * hy) ** 0.5
+                _2bz = (2 * mx * (q1q3 - q0q2) + 2 * my * (q2q3 + q0q1)
+                        + mz * (q0q0 - q1q1 - q2q2 + q3q3))
+                _4bx = 2 * _2bx
+                _4bz = 2 * _2bz
+
+                # Gradient descent step towards gravity and the field
+                f0 = 2 * (q1q3 - q0q2) - ax
+                f1 = 2 * (q0q1 + q2q3) - ay
+                f2 = 1 - 2 * (q1q1 + q2q2) - az
+                f3 = _2bx * (0.5 - q2q2 - q3q3) + _2bz * (q1q3 - q0q2) - mx
+                f4 = _2bx * (q1q2 - q0q3) + _2bz * (q0q1 + q2q3) - my
+                f5 = _2bx * (q0q2 + q1q3) + _2bz * (0.5 - q1q1 - q2q2) - mz
+                s0 = (-_2q2 * f0 + _2q1 * f1 - _2bz * q2 * f3
+                      + (-_2bx * q3 + _2bz * q1) * f4 + _2bx * q2 * f5)
+                s1 = (_2q3 * f0 + _2q0 * f1 - 2 * _2q1 * f2 + _2bz * q3 * f3
+                      + (_2bx * q2 + _2bz * q0) * f4
+                      + (_2bx * q3 - _4bz * q1) * f5)
+                s2 = (-_2q0 * f0 + _2q3 * f1 - 2 * _2q2 * f2
+                      + (-_4bx * q2 - _2bz * q0) * f3
+                      + (_2bx * q1 + _2bz * q3) * f4
+                      + (_2bx * q0 - _4bz * q2) * f5)
+                s3 = (_2q1 * f0 + _2q2 * f1 + (-_4bx * q3 + _2bz * q1) * f3
+                      + (-_2bx * q0 + _2bz * q2) * f4 + _2bx * q1 * f5)
+            else:
+                f0 = 2 * (q1 * q3 - q0 * q2) - ax
+                f1 = 2 * (q0 * q1 + q2 * q3) - ay
+                f2 = 1 - 2 * (q1 * q1 + q2 * q2) - az
+                s0 = -_2q2 * f0 + _2q1 * f1
+                s1 = _2q3 * f0 + _2q0 * f1 - 2 * _2q1 * f2
+                s2 = -_2q0 * f0 + _2q3 * f1 - 2 * _2q2 * f2
+                s3 = _2q1 * f0 + _2q2 * f1
+            n = self.beta * _inv_sqrt(s0 * s0 + s1 * s1 + s2 * s2 + s3 * s3)
+            qd0 -= n * s0
+            qd1 -= n * s1
+            qd2 -= n * s2
+            qd3 -= n * s3
+
+        q0 += qd0 * dt
+        q1 += qd1 * dt
+        q2 += qd2 * dt
+        q3 += qd3 * dt
+        n = _inv_sqrt(q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3)
+        q[0] = q0 * n
+        q[1] = q1 * n
+        q[2] = q2 * n
+        q[3] = q3 * n
+
+    @property
+    def quaternion(self):
+        """ W, X, Y, Z """
+        q = self.q
+        return q[0], q[1], q[2], q[3]
+
+    @property
+    def euler(self):
+        """ Roll, pitch and yaw in degrees. """
+        q0, q1, q2, q3 = self.q
+        roll = atan2(2 * (q0 * q1 + q2 * q3), 1 - 2 * (q1 * q1 + q2 * q2))
+        pitch = asin(min(max(2 * (q0 * q2 - q3 * q1), -1.0), 1.0))
+        yaw = atan2(2 * (q0 * q3 + q1 * q2), 1 - 2 * (q2 * q2 + q3 * q3))
+        return degrees(roll), degrees(pitch), degrees(yaw)
+
+    @property
+    def heading(self):
+        """ Degrees clockwise from magnetic north [0,360). """
+        q0, q1, q2, q3 = self.q
+        yaw = atan2(2 * (q0 * q3 + q1 * q2), 1 - 2 * (q2 * q2 + q3 * q3))
+        return -degrees(yaw) % 360
+
+
+class HeadingTracker:
+    def __init__(self, gain=0.2):
+        """gain is the share of the gyro drift removed by each new
+        magnetometer sample.
+        """
+        self.gain = gain
+        self.heading = None
+        self._last = None
+
+    def reset(self):
+        self.heading = None
+        self._last = None
+
+    def feed(self, sensor, now=None):
+        """Update from an mpu9250.MPU9250, timed by ticks_us() or now.
+        Returns the heading in degrees clockwise from magnetic north
+        [0,360), None until the magnetometer had a first sample.
+        """
+        if now is None:
+            now = ticks_us()
+        (ax, ay, az), (gx, gy, gz), temp = sensor.mpu6500.motion
+        n = _inv_sqrt(ax * ax + ay * ay + az * az)
+        ax *= n
+        ay *= n
+        az *= n
+        heading = self.heading
+        if heading is not None:
+            # Turning anticlockwise about up lowers the heading
+            rate = gx * ax + gy * ay + gz * az
+            heading -= degrees(rate) * ticks_diff(now, self._last) / 1000000
+        self._last = now
+
+        ak = sensor.ak8963
+        mx, my, mz = ak.magnetic
+        if ak.fresh:
+            # Field in MPU6500 axes, its horizontal part points north.
+            mx, my, mz = my, mx, -mz
+            d = mx * ax + my * ay + mz * az
+            nx = mx - d * ax
+            ny = my - d * ay
+            nz = mz - d * az
+            # West is up x north, the heading is that of the X axis.
+            measured = degrees(atan2(az * ny - ay * nz, nx))
+            if heading is None:
+                heading = measured
+            else:
+                heading += self.gain * ((measured - heading + 180) % 360 - 180)
+        if heading is not None:
+            heading %= 360
+        self.heading = heading
+        return heading
@@ -35,6 +35,7 @@ from micropython import const
 # pylint: enable=import-error
 
 _WIA = const(0x00)
+_ST1 = const(0x02)
 _HXL = const(0x03)
 _HXH = const(0x04)
 _HYL = const(0x05)
@@ -47,7 +48,10 @@ _ASAX = const(0x10)
 _ASAY = const(0x11)
 _ASAZ = const(0x12)
 
-_MODE_POWER_DOWN = 0b00000000
+_ST1_DRDY = const(0b00000001)
+_ST2_HOFL = const(0b00001000)
+
+MODE_POWER_DOWN = 0b00000000
 MODE_SINGLE_MEASURE = 0b00000001
 MODE_CONTINOUS_MEASURE_1 = 0b00000010 # 8Hz
 MODE_CONTINOUS_MEASURE_2 = 0b00000110 # 100Hz
@@ -66,22 +70,29 @@ class AK8963:
     def __init__(
         self, i2c, address=0x0c,
         mode=MODE_CONTINOUS_MEASURE_1, output=OUTPUT_16_BIT,
-        offset=(0, 0, 0), scale=(1, 1, 1)
+        offset=(0, 0, 0), scale=(1, 1, 1), asa=None, probe=True, matrix=None
     ):
         self.i2c = i2c
         self.address = address
-        self._offset = offset
-        self._scale = scale
+        self._mode = mode
+        self._output = output
+        self._magnetic = (0.0, 0.0, 0.0)
+        self.fresh = False
 
-        if 0x48 != self.whoami:
+        if probe and 0x48 != self.whoami:
             raise RuntimeError("AK8963 not found in I2C bus.")
 
-        # Sensitivity adjustement values
-        self._register_char(_CNTL1, _MODE_FUSE_ROM_ACCESS)
-        asax = self._register_char(_ASAX)
-        asay = self._register_char(_ASAY)
-        asaz = self._register_char(_ASAZ)
-        self._register_char(_CNTL1, _MODE_POWER_DOWN)
+        # Sensitivity adjustement values, unless cached ones were given
+        if asa is None:
+            self._register_char(_CNTL1, _MODE_FUSE_ROM_ACCESS)
+            asa = (
+                self._register_char(_ASAX),
+                self._register_char(_ASAY),
+                self._register_char(_ASAZ)
+            )
+            self._register_char(_CNTL1, MODE_POWER_DOWN)
+        self._asa = asa
+        asax, asay, asaz = asa
 
         # Should wait atleast 100us before next mode
         self._adjustement = (
@@ -98,49 +109,132 @@ class AK8963:
         else:
             self._so = _SO_14BIT
 
+        self.set_calibration(offset, scale, matrix)
+
     @property
     def magnetic(self):
         """
         X, Y, Z axis micro-Tesla (uT) as floats.
-        """
-        xyz = list(self._register_three_shorts(_HXL))
-        self._register_char(_ST2) # Enable updating readings again
 
-        # Apply factory axial sensitivy adjustements
-        xyz[0] *= self._adjustement[0]
-        xyz[1] *= self._adjustement[1]
-        xyz[2] *= self._adjustement[2]
+        ST1, the readings and ST2 come from a single burst read, ST2 being
+        part of it enables updating the readings again. When no new sample
+        is ready, or the sample overflowed, the previous value is returned
+        as is and `fresh` is False.
+        """
+        buf = self._register_block()
+        if not buf[0] & _ST1_DRDY or buf[7] & _ST2_HOFL:
+            self.fresh = False
+            return self._magnetic
+        x, y, z = ustruct.unpack_from("<hhh", buf, 1)
+
+        # Sensitivity adjustement, output scale, hard and soft iron are
+        # folded into one gain and bias, see set_calibration().
+        g = self._gain
+        b = self._bias
+        if len(g) == 3:
+            self._magnetic = (x * g[0] - b[0], y * g[1] - b[1], z * g[2] - b[2])
+        else:
+            self._magnetic = (
+                x * g[0] + y * g[1] + z * g[2] - b[0],
+                x * g[3] + y * g[4] + z * g[5] - b[1],
+                x * g[6] + y * g[7] + z * g[8] - b[2]
+            )
+        self.fresh = True
+        return self._magnetic
+
+    def magnetic_into(self, xyz):
+        """
+        X, Y, Z axis readings with the factory sensitivity adjustement
+        applied in integer math into `xyz`, a caller owned array('i') or
+        similar, adjusted values can exceed a short. Nothing is allocated
+        on the heap. Multiply by 0.15 (16 bit output) or 0.6 (14 bit
+        output) for uT. Returns False and leaves `xyz` alone when there
+        is no new sample or it overflowed, see `magnetic`.
+        """
+        buf = self._register_block()
+        if not buf[0] & _ST1_DRDY or buf[7] & _ST2_HOFL:
+            self.fresh = False
+            return False
+
+        asa = self._asa
+        i = 0
+        while i < 3:
+            value = buf[i * 2 + 1] | buf[i * 2 + 2] << 8
+            if value & 0x8000:
+                value -= 0x10000
+            # H * ((ASA - 128) * 0.5 / 128 + 1) == H * (ASA + 128) / 256
+            xyz[i] = value * (asa[i] + 128) >> 8
+            i += 1
+        self.fresh = True
+        return True
+
+    def set_calibration(self, offset=(0, 0, 0), scale=(1, 1, 1), matrix=None):
+        """
+        Hard iron `offset` in uT and either a per axis soft iron `scale` or
+        a full 3x3 soft iron `matrix` as 9 values, row by row, which is
+        then used instead of the scale. `magnetic` returns
+        scale * (H * ASA * SO - offset), or matrix times the parenthesis.
+
+        All of it is folded here into one gain and one bias per axis, so a
+        reading costs a single multiply and subtract per axis, or three
+        multiplies per axis with a matrix.
+        """
+        self._offset = tuple(offset)
+        self._scale = tuple(scale)
+        self._matrix = None if matrix is None else tuple(matrix)
 
-        # Apply output scale determined in constructor
         so = self._so
-        xyz[0] *= so
-        xyz[1] *= so
-        xyz[2] *= so
+        k = [adjustement * so for adjustement in self._adjustement]
+        if matrix is None:
+            self._gain = tuple([k[i] * scale[i] for i in range(3)])
+            self._bias = tuple([offset[i] * scale[i] for i in range(3)])
+        else:
+            self._gain = tuple([matrix[i] * k[i % 3] for i in range(9)])
+            self._bias = tuple([
+                matrix[i * 3] * offset[0] + matrix[i * 3 + 1] * offset[1]
+                + matrix[i * 3 + 2] * offset[2]
+                for i in range(3)
+            ])
 
-        # Apply hard iron ie. offset bias from calibration
-        xyz[0] -= self._offset[0]
-        xyz[1] -= self._offset[1]
-        xyz[2] -= self._offset[2]
+    @property
+    def calibration(self):
+        """ Offset, scale and matrix (or None) as set last. """
+        return self._offset, self._scale, self._matrix
 
-        # Apply soft iron ie. scale bias from calibration
-        xyz[0] *= self._scale[0]
-        xyz[1] *= self._scale[1]
-        xyz[2] *= self._scale[2]
+    @property
+    def mode(self):
+        return self._mode
 
-        return tuple(xyz)
+    def set_mode(self, mode):
+        """
+        Switch between power down, single measure and the 8Hz and 100Hz
+        continuous modes, keeping the output bit setting.
+        """
+        # Power down first and wait atleast 100us before the next mode
+        self._register_char(_CNTL1, MODE_POWER_DOWN | self._output)
+        utime.sleep_us(100)
+        self._register_char(_CNTL1, mode | self._output)
+        self._mode = mode
 
     @property
     def adjustement(self):
         return self._adjustement
 
+    @property
+    def asa(self):
+        """
+        Raw fuse ROM sensitivity adjustement values, can be cached and
+        passed back to the constructor to skip the fuse ROM access.
+        """
+        return self._asa
+
     @property
     def whoami(self):
         """ Value of the whoami register. """
         return self._register_char(_WIA)
 
     def calibrate(self, count=256, delay=200):
-        self._offset = (0, 0, 0)
-        self._scale = (1, 1, 1)
+        self.set_calibration()
 
         reading = self.magnetic
         minx = maxx = reading[0]
@@ -163,7 +257,7 @@ class AK8963:
         offset_y = (maxy + miny) / 2
         offset_z = (maxz + minz) / 2
 
-        self._offset = (offset_x, offset_y, offset_z)
+        offset = (offset_x, offset_y, offset_z)
 
         # Soft iron correction
         avg_delta_x = (maxx - minx) / 2
@@ -176,7 +270,8 @@ class AK8963:
         scale_y = avg_delta / avg_delta_y
         scale_z = avg_delta / avg_delta_z
 
-        self._scale = (scale_x, scale_y, scale_z)
+        scale = (scale_x, scale_y, scale_z)
+        self.set_calibration(offset, scale)
 
         return self._offset, self._scale
 
@@ -192,6 +287,11 @@ class AK8963:
         self.i2c.readfrom_mem_into(self.address, register, buf)
         return ustruct.unpack("<hhh", buf)
 
+    def _register_block(self, buf=bytearray(8)):
+        # ST1, HXL to HZH and ST2
+        self.i2c.readfrom_mem_into(self.address, _ST1, buf)
+        return buf
+
     def _register_char(self, register, value=None, buf=bytearray(1)):
         if value is None:
             self.i2c.readfrom_mem_into(self.address, register, buf)
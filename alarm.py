@@ -0,0 +1,95 @@
+'''
+alarm.py - alarm clock on top of the PCF8563 alarm registers.
+
+Any number of alarms is kept in a small file, only the next one to ring
+is programmed into the PCF8563. Its interrupt line wakes the ESP32 from
+deep sleep, so nothing has to poll while waiting.
+
+An alarm is (hours, minutes, days), days is a bit mask of weekdays with
+bit 0 for Sunday, the same numbering as PCF8563.day(). An alarm with no
+days set rings once and is then removed.
+'''
+EVERY_DAY = 0x7F
+ONCE = 0x00
+
+
+class AlarmClock:
+    def __init__(self, pcf, path='alarms.dat'):
+        """pcf is an initialized pcf8563.PCF8563.
+        """
+        self.pcf = pcf
+        self.path = path
+        self.alarms = []
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            data = b''
+        for i in range(0, len(data) - 2, 3):
+            self.alarms.append((data[i], data[i + 1], data[i + 2]))
+
+    def save(self):
+        data = bytearray()
+        for alarm in self.alarms:
+            data.extend(bytes(alarm))
+        with open(self.path, 'wb') as f:
+            f.write(data)
+
+    def add(self, hours, minutes, days=EVERY_DAY):
+        if hours < 0 or hours > 23:
+            raise ValueError('Hours is out of range [0,23].')
+        if minutes < 0 or minutes > 59:
+            raise ValueError('Minutes is out of range [0,59].')
+        self.alarms.append((hours, minutes, days & EVERY_DAY))
+        self.save()
+
+    def clear(self):
+        self.alarms = []
+        self.save()
+
+    def next(self, now):
+        """Return (hours, minutes, weekday) of the next alarm after now,
+        a tuple as returned by PCF8563.datetime(), or None.
+        """
+        day, hours, minutes = now[3], now[4], now[5]
+        current = hours * 60 + minutes
+        best = None
+        for h, m, days in self.alarms:
+            for ahead in range(8):
+                weekday = (day + ahead) % 7
+                if days and not days & (1 << weekday):
+                    continue
+                wait = ahead * 1440 + h * 60 + m - current
+                if wait > 0:
+                    if best is None or wait < best[0]:
+                        best = (wait, h, m, weekday)
+                    break
+        return best and best[1:]
+
+    def arm(self, now):
+        """Program the next alarm into the PCF8563 and enable its
+        interrupt, or switch the alarm off when there is none.
+        """
+        upcoming = self.next(now)
+        if upcoming is None:
+            self.pcf.clear_alarm()
+            self.pcf.disable_alarm_interrupt()
+        else:
+            hours, minutes, weekday = upcoming
+            self.pcf.set_daily_alarm(hours=hours, minutes=minutes,
+                                     weekday=weekday)
+            self.pcf.enable_alarm_interrupt()
+        return upcoming
+
+    def acknowledge(self, now):
+        """Call once a ringing alarm is handled: one-shot alarms for this
+        minute are dropped and the following alarm is armed.
+        """
+        hours, minutes = now[4], now[5]
+        once = [a for a in self.alarms
+                if a[2] == ONCE and a[0] == hours and a[1] == minutes]
+        if once:
+            for a in once:
+                self.alarms.remove(a)
+            self.save()
+        return self.arm(now)
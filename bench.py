@@ -0,0 +1,43 @@
+'''
+bench.py - measuring helpers for the REPL.
+
+    >>> import bench
+    >>> from array import array
+    >>> xyz = array('h', (0, 0, 0))
+    >>> bench.allocated(lambda: sensor.mpu6500.acceleration_into(xyz))
+    0
+    >>> bench.timed(lambda: sensor.mpu6500.acceleration_into(xyz))
+'''
+import gc
+from utime import ticks_us, ticks_diff
+
+
+def allocated(func, count=100):
+    """Bytes of heap allocated per call of func(), averaged over count
+    calls with the garbage collector off. Zero proves an allocation-free
+    code path.
+    """
+    gc.collect()
+    gc.disable()
+    n = count
+    before = gc.mem_alloc()
+    while n:
+        func()
+        n -= 1
+    after = gc.mem_alloc()
+    gc.enable()
+    return (after - before) // count
+
+
+def timed(func, count=100):
+    """Microseconds per call of func(), averaged over count calls. The
+    garbage collector runs first, so a collection in the middle of the
+    measurement is less likely.
+    """
+    gc.collect()
+    n = count
+    start = ticks_us()
+    while n:
+        func()
+        n -= 1
+    return ticks_diff(ticks_us(), start) // count
@@ -1,8 +1,10 @@
 # This file is executed on every boot (including wake-boot from deepsleep)
-import network
+import machine
 
-sta_if = network.WLAN(network.STA_IF)
-ap_if = network.WLAN(network.AP_IF)
+# The radios are already off after a deep sleep wake, so the network
+# module is only needed to switch them off on a cold boot.
+if machine.reset_cause() != machine.DEEPSLEEP_RESET:
+    import network
 
-sta_if.active(False)
-ap_if.active(False)
+    network.WLAN(network.STA_IF).active(False)
+    network.WLAN(network.AP_IF).active(False)
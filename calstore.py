@@ -0,0 +1,109 @@
+'''
+calstore.py - binary calibration file for the T-Wristband sensors.
+
+The file starts with a magic and a version byte, then holds one record
+per calibration: tag, payload length, timestamp (seconds since 2000) and
+the payload packed with the format from FORMATS. A CRC32 of everything
+before it closes the file. It is written to a temporary file which is
+then renamed over the old one, so a power loss mid-write leaves either
+calibration in place.
+'''
+import os
+import time
+import ustruct
+from binascii import crc32
+
+VERSION = 1
+_MAGIC = b'TWCL'
+_HEADER = '<4sB'
+_RECORD = '<BBI'
+
+MAG = 1  # magnetometer offset and scale, uT
+ASA = 2  # AK8963 fuse ROM sensitivity adjustement values
+GYRO = 3  # gyro bias, rad/s
+ACCEL = 4  # accelerometer bias, m/s^2
+GYRO_OFFSET = 5  # MPU6500 gyro offset registers
+ACCEL_OFFSET = 6  # MPU6500 accelerometer offset registers
+MAG_MATRIX = 7  # magnetometer offset, uT, and 3x3 soft iron matrix
+
+FORMATS = {
+    MAG: '<6f',
+    ASA: '<3B',
+    GYRO: '<3f',
+    ACCEL: '<3f',
+    GYRO_OFFSET: '<3h',
+    ACCEL_OFFSET: '<3h',
+    MAG_MATRIX: '<12f',
+}
+
+
+class CalibrationStore:
+    def __init__(self, path='calib.bin'):
+        self.path = path
+        self._records = {}
+        self.load()
+
+    def load(self):
+        """Read the file, return False if it is missing or damaged. Falls
+        back to the temporary file, which holds the calibration when a
+        power loss came between the remove and the rename of save().
+        """
+        return self._read(self.path) or self._read(self.path + '.tmp')
+
+    def _read(self, path):
+        self._records = {}
+        try:
+            with open(path, 'rb') as f:
+                data = memoryview(f.read())
+        except OSError:
+            return False
+        end = len(data) - 4
+        if (end < 5 or ustruct.unpack_from('<I', data, end)[0] != crc32(data[:end])
+                or ustruct.unpack_from(_HEADER, data)
+                != (_MAGIC, VERSION)):
+            return False
+        records = {}
+        i = 5
+        while i + 6 <= end:
+            tag, length, stamp = ustruct.unpack_from(_RECORD, data, i)
+            i += 6
+            # Unknown tags from newer firmware are kept as they are.
+            records[tag] = (stamp, data[i:i + length])
+            i += length
+        self._records = records
+        return True
+
+    def get(self, tag):
+        """Values of the record unpacked straight from the file buffer,
+        or None if it was never saved.
+        """
+        record = self._records.get(tag)
+        if record is None:
+            return None
+        return ustruct.unpack_from(FORMATS[tag], record[1])
+
+    def timestamp(self, tag):
+        record = self._records.get(tag)
+        return record and record[0]
+
+    def set(self, tag, values, stamp=None):
+        if stamp is None:
+            stamp = int(time.time())
+        self._records[tag] = (stamp, ustruct.pack(FORMATS[tag], *values))
+
+    def save(self):
+        data = bytearray(ustruct.pack(_HEADER, _MAGIC, VERSION))
+        for tag in sorted(self._records):
+            stamp, payload = self._records[tag]
+            data.extend(ustruct.pack(_RECORD, tag, len(payload), stamp))
+            data.extend(payload)
+        data.extend(ustruct.pack('<I', crc32(data)))
+
+        temp = self.path + '.tmp'
+        with open(temp, 'wb') as f:
+            f.write(data)
+        try:
+            os.rename(temp, self.path)
+        except OSError:  # FAT does not rename over an existing file.
+            os.remove(self.path)
+            os.rename(temp, self.path)
@@ -0,0 +1,360 @@
+'''
+magcal.py - magnetometer calibration by least squares ellipsoid fit.
+
+Tracking the minimum and maximum of each axis, as AK8963.calibrate()
+does, is broken by a single outlier and cannot model soft iron that is
+rotated against the sensor axes. Here every sample is folded into the
+normal equations of the ellipsoid
+
+    a x2 + b y2 + c z2 + 2d xy + 2e xz + 2f yz + 2g x + 2h y + 2i z = 1
+
+which take 54 floats whatever the number of samples. solve() returns the
+hard iron offset and a symmetric 3x3 matrix which maps the ellipsoid back
+onto a sphere, ready for AK8963.set_calibration():
+
+    >>> fit = magcal.EllipsoidFit()
+    >>> fit.add(*sensor.magnetic)  # Repeated while turning the bracelet.
+    >>> offset, matrix, radius = fit.solve()
+    >>> sensor.ak8963.set_calibration(offset, matrix=matrix)
+
+Samples must be in uT without calibration applied, and should cover the
+sphere: `coverage` tells how much of it was seen, `residual` how well
+the samples lie on the fitted ellipsoid.
+
+MagCalibrator drives a fit from the AK8963 in its 100Hz mode without
+blocking: call step() from the screen loop until it returns False. It
+stops as soon as enough of the sphere was covered and the solution no
+longer moves. When that does not happen within its limit, or when
+cancel() is called, the previous calibration stays.
+'''
+from array import array
+from ak8963 import MODE_CONTINOUS_MEASURE_2
+
+_SIZE = 9  # Unknowns, a to i
+_BINS = 24  # Cube faces split in four
+_FIELD_LOW = 25  # uT, the geomagnetic field is about 22 to 67 uT.
+_FIELD_HIGH = 70
+_FIT = 0.03  # Residual of a fit whose centre is trusted for the coverage.
+_MOVED = 5  # uT the centre may move without binning the sphere again.
+
+
+def _gauss(m, v):
+    # Solve m x = v in place by elimination with partial pivoting, m is a
+    # list of rows. Returns x or None when m is singular.
+    n = len(v)
+    for col in range(n):
+        pivot = col
+        for row in range(col + 1, n):
+            if abs(m[row][col]) > abs(m[pivot][col]):
+                pivot = row
+        if abs(m[pivot][col]) < 1e-12:
+            return None
+        m[col], m[pivot] = m[pivot], m[col]
+        v[col], v[pivot] = v[pivot], v[col]
+        for row in range(col + 1, n):
+            f = m[row][col] / m[col][col]
+            if f:
+                for k in range(col, n):
+                    m[row][k] -= f * m[col][k]
+                v[row] -= f * v[col]
+    x = [0.0] * n
+    for row in range(n - 1, -1, -1):
+        s = v[row]
+        for k in range(row + 1, n):
+            s -= m[row][k] * x[k]
+        x[row] = s / m[row][row]
+    return x
+
+
+def _jacobi(a):
+    # Eigenvalues and eigenvectors of the symmetric 3x3 matrix a by
+    # Jacobi rotations. Returns the eigenvalues and a matrix with the
+    # eigenvectors in its columns.
+    a = [list(row) for row in a]
+    v = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+    for sweep in range(16):
+        off = abs(a[0][1]) + abs(a[0][2]) + abs(a[1][2])
+        if off < 1e-9 * (abs(a[0][0]) + abs(a[1][1]) + abs(a[2][2])):
+            break
+        for p, q in ((0, 1), (0, 2), (1, 2)):
+            if a[p][q] == 0:
+                continue
+            theta = (a[q][q] - a[p][p]) / (2 * a[p][q])
+            t = 1 / (abs(theta) + (theta * theta + 1) ** 0.5)
+            if theta < 0:
+                t = -t
+            c = 1 / (t * t + 1) ** 0.5
+            s = t * c
+            for k in range(3):
+                akp, akq = a[k][p], a[k][q]
+                a[k][p] = c * akp - s * akq
+                a[k][q] = s * akp + c * akq
+            for k in range(3):
+                apk, aqk = a[p][k], a[q][k]
+                a[p][k] = c * apk - s * aqk
+                a[q][k] = s * apk + c * aqk
+            for k in range(3):
+                vkp, vkq = v[k][p], v[k][q]
+                v[k][p] = c * vkp - s * vkq
+                v[k][q] = s * vkp + c * vkq
+    return (a[0][0], a[1][1], a[2][2]), v
+
+
+class EllipsoidFit:
+    def __init__(self, origin=(0.0, 0.0, 0.0), unit=50.0):
+        """Samples are moved by -origin and divided by unit (uT) before
+        they are accumulated, which keeps the sums well conditioned in
+        single precision floats. Use the previous hard iron offset as the
+        origin when there is one. The fit only fails if the origin lies
+        right on the ellipsoid.
+        """
+        self.origin = tuple(origin)
+        self.unit = unit
+        self._ata = array('f', [0.0] * (_SIZE * (_SIZE + 1) // 2))
+        self._atb = array('f', [0.0] * _SIZE)
+        self._row = array('f', [0.0] * _SIZE)
+        self._centre = array('f', [0.0] * 3)
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self._ata)):
+            self._ata[i] = 0.0
+        for i in range(_SIZE):
+            self._atb[i] = 0.0
+        self.count = 0
+        self.residual = None
+        self._bins = 0
+        for i in range(3):
+            self._centre[i] = 0.0
+
+    def add(self, x, y, z):
+        """Accumulate one magnetometer sample in uT."""
+        o = self.origin
+        s = 1 / self.unit
+        x = (x - o[0]) * s
+        y = (y - o[1]) * s
+        z = (z - o[2]) * s
+        r = self._row
+        r[0] = x * x
+        r[1] = y * y
+        r[2] = z * z
+        r[3] = 2 * x * y
+        r[4] = 2 * x * z
+        r[5] = 2 * y * z
+        r[6] = 2 * x
+        r[7] = 2 * y
+        r[8] = 2 * z
+
+        ata = self._ata
+        atb = self._atb
+        k = 0
+        for i in range(_SIZE):
+            ri = r[i]
+            atb[i] += ri
+            for j in range(i, _SIZE):
+                ata[k] += ri * r[j]
+                k += 1
+        self.count += 1
+        self._cover(x, y, z)
+
+    def _cover(self, x, y, z):
+        # Direction from the centre, binned by the cube face it points at
+        # and the quadrant within that face.
+        c = self._centre
+        dx = x - c[0]
+        dy = y - c[1]
+        dz = z - c[2]
+        ax, ay, az = abs(dx), abs(dy), abs(dz)
+        if ax >= ay and ax >= az:
+            face, u, v = dx, dy, dz
+            axis = 0
+        elif ay >= az:
+            face, u, v = dy, dx, dz
+            axis = 1
+        else:
+            face, u, v = dz, dx, dy
+            axis = 2
+        index = axis * 8 + (face < 0) * 4 + (u < 0) * 2 + (v < 0)
+        self._bins |= 1 << index
+
+    @property
+    def coverage(self):
+        """Part of the sphere of directions seen, 0 to 1 in 24 steps.
+        Directions are taken from the origin, and from the centre of the
+        latest solve() once it fits well with a plausible geomagnetic
+        field strength: a small patch of the sphere also fits a small ellipsoid of
+        its own, around which it would look covered. When that centre
+        moves by more than 5uT the coverage starts over.
+        """
+        bins = self._bins
+        n = 0
+        while bins:
+            n += bins & 1
+            bins >>= 1
+        return n / _BINS
+
+    def solve(self):
+        """Return (offset, matrix, radius): the hard iron offset in uT,
+        the soft iron correction as 9 values row by row and the field
+        strength in uT, or None when the samples do not define an
+        ellipsoid. Also sets `residual`, the RMS distance of the samples
+        from the ellipsoid as a fraction of the radius.
+        """
+        if self.count < _SIZE:
+            return None
+        m = [[0.0] * _SIZE for i in range(_SIZE)]
+        k = 0
+        for i in range(_SIZE):
+            for j in range(i, _SIZE):
+                m[i][j] = m[j][i] = self._ata[k]
+                k += 1
+        full = [list(row) for row in m]
+        u = _gauss(m, list(self._atb))
+        if u is None:
+            return None
+
+        # Sum of squared equation errors, straight from the normal equations
+        error = self.count
+        for i in range(_SIZE):
+            row = full[i]
+            error += u[i] * (sum([row[j] * u[j] for j in range(_SIZE)])
+                             - 2 * self._atb[i])
+
+        a = [[u[0], u[3], u[4]], [u[3], u[1], u[5]], [u[4], u[5], u[2]]]
+        center = _gauss([list(row) for row in a], [-u[6], -u[7], -u[8]])
+        if center is None:
+            return None
+        # (x - center)' a (x - center) = 1 + center' a center
+        k = 1 + sum([center[i] * sum([a[i][j] * center[j] for j in range(3)])
+                     for i in range(3)])
+        values, vectors = _jacobi(a)
+        values = [value / k for value in values]
+        if min(values) <= 0:
+            return None
+
+        unit = self.unit
+        radius = 1.0
+        for value in values:
+            radius *= unit / value ** 0.5
+        radius **= 1 / 3
+        gains = [value ** 0.5 * radius / unit for value in values]
+        matrix = []
+        for i in range(3):
+            for j in range(3):
+                matrix.append(sum([vectors[i][n] * gains[n] * vectors[j][n]
+                                   for n in range(3)]))
+        offset = tuple([self.origin[i] + center[i] * unit for i in range(3)])
+        self.residual = (max(error, 0) / self.count) ** 0.5 / (2 * abs(k))
+        if _FIELD_LOW <= radius <= _FIELD_HIGH and self.residual < _FIT:
+            c = self._centre
+            moved = sum([(center[i] - c[i]) ** 2 for i in range(3)]) ** 0.5
+            if moved * unit > _MOVED:
+                self._bins = 0  # Binned around a wrong centre, start over.
+            for i in range(3):
+                c[i] = center[i]
+        return offset, tuple(matrix), radius
+
+
+class MagCalibrator:
+    def __init__(self, ak8963, goal=0.75, tolerance=0.5, settle=3,
+                 interval=50, limit=6000):
+        """ak8963 is an initialized ak8963.AK8963. The calibration is done
+        once `goal` of the sphere is covered and `settle` solutions in a
+        row, one per `interval` samples, moved less than `tolerance` uT.
+        It gives up after `limit` samples, one minute at 100Hz, and then
+        keeps the previous calibration with `solution` None.
+        """
+        self.ak8963 = ak8963
+        self.goal = goal
+        self.tolerance = tolerance
+        self.settle = settle
+        self.interval = interval
+        self.limit = limit
+        self.fit = None
+        self.solution = None
+        self.done = True
+
+    def start(self):
+        ak = self.ak8963
+        self._previous = ak.calibration
+        self._mode = ak.mode
+        self.fit = EllipsoidFit(origin=self._previous[0])
+        self.solution = None
+        self.done = False
+        self._stable = 0
+        self._since = 0
+        ak.set_calibration()  # The fit needs uncalibrated samples.
+        ak.set_mode(MODE_CONTINOUS_MEASURE_2)
+
+    def step(self):
+        """Take the next sample if the AK8963 has one. Returns True while
+        more samples are needed.
+        """
+        if self.done:
+            return False
+        ak = self.ak8963
+        xyz = ak.magnetic
+        if not ak.fresh:
+            return True
+        fit = self.fit
+        fit.add(*xyz)
+        self._since += 1
+        if self._since >= self.interval:
+            self._since = 0
+            self._update()
+        if fit.count >= self.limit and not self.done:
+            self.solution = None  # Not settled or not covered, give up.
+            self._finish()
+        return not self.done
+
+    def _update(self):
+        solution = self.fit.solve()
+        if solution is None:
+            self._stable = 0
+            return
+        if self.solution is not None:
+            offset, matrix, radius = solution
+            last = self.solution
+            moved = sum([(offset[i] - last[0][i]) ** 2 for i in range(3)]) ** 0.5
+            if moved < self.tolerance and abs(radius - last[2]) < self.tolerance:
+                self._stable += 1
+            else:
+                self._stable = 0
+        self.solution = solution
+        if self._stable >= self.settle and self.fit.coverage >= self.goal:
+            self._finish()
+
+    def _finish(self):
+        ak = self.ak8963
+        self.done = True
+        if self.solution is None:
+            ak.set_calibration(*self._previous)
+        else:
+            offset, matrix, radius = self.solution
+            ak.set_calibration(offset, matrix=matrix)
+        ak.set_mode(self._mode)
+
+    def cancel(self):
+        """Stop and put the previous calibration back."""
+        self.solution = None
+        if not self.done:
+            self._finish()
+
+    @property
+    def progress(self):
+        """0 to 1, half for the sphere coverage, half for the stability of
+        the solution.
+        """
+        if self.fit is None:
+            return 0.0
+        covered = min(self.fit.coverage / self.goal, 1)
+        return (covered + min(self._stable / self.settle, 1)) / 2
+
+    @property
+    def quality(self):
+        """0 to 1 from the fit residual, 1 for samples right on the
+        ellipsoid, 0 for 5% off or worse.
+        """
+        if self.solution is None or self.fit.residual is None:
+            return 0.0
+        return max(0.0, 1 - self.fit.residual / 0.05)
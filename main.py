@@ -17,24 +17,76 @@
     https://github.com/chicory-ru/t-wristband
 '''
 
-from machine import I2C, Pin, SPI , ADC, deepsleep
+from machine import I2C, Pin, SPI , ADC, deepsleep, lightsleep
+from machine import reset_cause, wake_reason, DEEPSLEEP_RESET, EXT0_WAKE, EXT1_WAKE
 import st7789
 import time
+from array import array
 import pcf8563
-import vga2_bold_16x32
-import vga2_8x16
+import wallclock
+import alarm
+import rtcstore
+import calstore
+import powerstate
 import esp32
-import mpu9250
-import ak8963
-from calib import offset, scale
 
+power = powerstate.PowerManager()  # The sensor is attached in init_sensors().
+
+PACING_RTC = True  # Frames are paced by the PCF8563 1 Hz timer on pin 34.
+
+def pace_start():
+    global job_left, pace_edge
+    if PACING_RTC:
+        # The pacing borrows the countdown timer from the background jobs.
+        job_left = r.timer_remaining() if r.check_if_timer_on() else 0
+        r.set_timer(1, pcf8563.TIMER_SOURCE_1HZ)
+        # Level mode: the line stays low until next_second() clears the
+        # flag, a pulse could still be low when the next light sleep starts.
+        r.enable_timer_interrupt()
+        esp32.wake_on_ext0(pin=rtc_int, level=esp32.WAKEUP_ALL_LOW)
+        # A pin IRQ does not wake the light sleep, next_second() watches
+        # the touchpad through ext1 and currentime() handles the release.
+        touchpad.irq(handler=None)
+        pace_edge = True  # The clock syncs on the first timer edge.
+
+def pace_stop():
+    if PACING_RTC:
+        esp32.wake_on_ext0(pin=None, level=esp32.WAKEUP_ALL_LOW)
+        esp32.wake_on_ext1(pins=None, level=esp32.WAKEUP_ALL_LOW)
+        r.disable_timer_interrupt()
+        r.disable_timer()
+        touchpad.irq(trigger=Pin.IRQ_FALLING, handler=sleep)
+
+def next_second():
+    # Light sleep until the next second boundary or until the touchpad
+    # changes. Returns True when woken by the touchpad.
+    global pace_edge
+    if PACING_RTC:
+        level = esp32.WAKEUP_ALL_LOW if touchpad.value() else esp32.WAKEUP_ANY_HIGH
+        esp32.wake_on_ext1(pins=(touchpad,), level=level)
+        lightsleep(1100)
+        reason = wake_reason()
+        if reason == EXT0_WAKE:
+            r.clear_timer()
+            if pace_edge:
+                pace_edge = False
+                clock.sync(edge=True)
+        return reason == EXT1_WAKE
+    time.sleep(0.96)
+    return False
+
+TILT = const(167)  # 0.1 m/s^2 in raw 2G accelerometer units.
+gyro = array('h', (0, 0, 0))  # Reused by every read, no garbage per frame.
+
+@power.screen(powerstate.ACCEL_LOW)
 def currentime():
     global touch
-    c, flag = 0, 0
+    c, flag, touched = 0, -1, False
+    pace_start()
     while c < 60:  # Show time 60 second.
-        gyro = sensor.acceleration
+        sensor.mpu6500.acceleration_into(gyro)
         if touch < 1:
-            if gyro[0] < -0.1 and abs(gyro[0]) > abs(gyro[1]):
+            if gyro[0] < -TILT and abs(gyro[0]) > abs(gyro[1]):
                 if flag == 3:
                     currentime_horizontal(c)
                 else:
@@ -44,7 +96,7 @@ def currentime():
                     static_graphics_horizontal()
                     currentime_horizontal(c)
                     continue
-            elif gyro[0] > 0.1 and abs(gyro[0]) > abs(gyro[1]):
+            elif gyro[0] > TILT and abs(gyro[0]) > abs(gyro[1]):
                 if flag == 1:
                     currentime_horizontal(c)
                 else:
@@ -54,7 +106,7 @@ def currentime():
                     static_graphics_horizontal()
                     currentime_horizontal(c)
                     continue
-            elif gyro[1] > 0.1 and abs(gyro[0]) < abs(gyro[1]):
+            elif gyro[1] > TILT and abs(gyro[0]) < abs(gyro[1]):
                 if flag == 2:
                     currentime_vertical(c)
                 else:
@@ -64,7 +116,7 @@ def currentime():
                     static_graphics_vertical()
                     currentime_vertical(c)
                     continue
-            elif gyro[1] < -0.1 and abs(gyro[0]) < abs(gyro[1]):
+            elif gyro[1] < -TILT and abs(gyro[0]) < abs(gyro[1]):
                 if flag == 0:
                     static_graphics_vertical()
                     currentime_vertical(c)
@@ -76,25 +128,28 @@ def currentime():
                     currentime_vertical(c)
                     continue
                 
-        touch += touchpad.value()
+        pressed = touchpad.value()
+        if not pressed and (touch or touched):
+            break  # Released, sleep() picks the screen from the count.
+        touch += pressed
         if touch > 1 and touch < 5:
             if touch == 2:
                 display.fill(st7789.BLACK)
             display.text(vga2_bold_16x32, 'Date', 6, 25, 0xF81F)
-            time.sleep(1)
-            continue
-        if touch > 4:
+        elif touch > 4:
             if touch == 5:
                 display.fill(st7789.BLACK)
             display.text(vga2_bold_16x32, 'Menu', 6, 25, 0xF81F)
-            time.sleep(1)
-            continue
         c += 1
-        time.sleep(0.96)
+        touched = next_second()
+    pace_stop()
+    if flag >= 0:
+        state.set('rotation', flag)
 
 def currentime_horizontal(c):
-    display.text(vga2_8x16, f'{r.seconds():0>2}', 129, 20, st7789.YELLOW)
-    display.text(vga2_bold_16x32, f'{r.hours():0>2}:{r.minutes():0>2}', 20, 10)
+    hours, minutes, seconds = clock.datetime()[4:]
+    display.text(vga2_8x16, f'{seconds:0>2}', 129, 20, st7789.YELLOW)
+    display.text(vga2_bold_16x32, f'{hours:0>2}:{minutes:0>2}', 20, 10)
     x1, x2 = 142, 130
     if c & 1:
         x1, x2 = x2, x1
@@ -103,11 +158,13 @@ def currentime_horizontal(c):
     display.line(136, 41, x2, 60, st7789.GREEN)            
     display.fill_circle(x2, 60, 3, st7789.GREEN) 
     draw_battery()
+    mark_first_pixel()
       
 def currentime_vertical(c):
-    display.text(vga2_8x16,  f'{r.seconds():0>2}', 50, 70, st7789.YELLOW)
-    display.text(vga2_bold_16x32, f'{r.hours():0>2}:', 0, 17)
-    display.text(vga2_bold_16x32, f'{r.minutes():0>2}', 47, 17)
+    hours, minutes, seconds = clock.datetime()[4:]
+    display.text(vga2_8x16,  f'{seconds:0>2}', 50, 70, st7789.YELLOW)
+    display.text(vga2_bold_16x32, f'{hours:0>2}:', 0, 17)
+    display.text(vga2_bold_16x32, f'{minutes:0>2}', 47, 17)
     x1, x2 = 50, 64
     if c & 1:
         x1, x2 = x2, x1
@@ -116,6 +173,15 @@ def currentime_vertical(c):
     display.line(57, 92, x2, 130, st7789.GREEN)
     display.fill_circle(x2, 130, 3, st7789.GREEN)
     draw_battery(horizontal=False)
+    mark_first_pixel()
+
+first_pixel = 0
+
+def mark_first_pixel():  # Keep the wake to first clock frame time once.
+    global first_pixel
+    if not first_pixel:
+        first_pixel = time.ticks_ms()
+        state.set('first_pixel', min(first_pixel, 0xFFFF))
 
 def static_graphics_vertical():
     display.circle(57, 77, 15, st7789.GREEN)
@@ -157,15 +223,16 @@ def draw_battery(horizontal=True):
 weekday = ('Sunday   ', 'Monday   ', 'Tuesday  ', 'Wednesday', 'Thursday ',
            'Friday   ', 'Saturday ')
 
+@power.screen(powerstate.ACCEL_LOW)
 def calendar():
     horizontal_rotation()
-    day_ = r.day()
+    year, month, date, day_ = clock.datetime()[:4]
     if day_ == 6 or day_ == 0:
         color = st7789.RED
     else:
         color = st7789.GREEN
     display.fill(st7789.BLACK)
-    display.text(vga2_bold_16x32, f'{r.date():0>2}.{r.month():0>2}.20{r.year():0>2}', 0, 10)
+    display.text(vga2_bold_16x32, f'{date:0>2}.{month:0>2}.20{year:0>2}', 0, 10)
     display.text(vga2_bold_16x32, weekday[day_], 6, 44, color)
     
     tim = time.time()
@@ -181,7 +248,7 @@ def horizontal_rotation():
     else:
         display.rotation(3)
 
-def time_set():
+def pick_time():
     display.fill(st7789.BLACK)
     time_ = [0, 0]
     color1 = st7789.RED
@@ -214,8 +281,48 @@ def time_set():
         _set_time_print()   
     display.fill(st7789.BLACK)
     if flag == 2:
+        return time_
+
+def time_set():
+    time_ = pick_time()
+    if time_:
         r.write_all(seconds=0, minutes=time_[1], hours=time_[0])
+        clock.sync(adjusted=True)
+        alarms.arm(clock.datetime())  # The weekday may have changed.
+        print_saved()
+
+def alarm_set():
+    time_ = pick_time()
+    if time_:
+        alarms.add(time_[0], time_[1])
+        alarms.arm(clock.datetime())
         print_saved()
+
+def alarm_clear():
+    alarms.clear()
+    alarms.arm(clock.datetime())
+    print_saved()
+
+def ring():  # Woken by the PCF8563 alarm.
+    init_display()
+    now = clock.datetime()
+    display.rotation(1)
+    display.fill(st7789.BLACK)
+    display.text(vga2_bold_16x32, f'{now[4]:0>2}:{now[5]:0>2}', 40, 25, st7789.RED)
+    tim = time.time()
+    while touchpad.value() == 0 and time.time()-tim < 60:
+        led.value(not led.value())
+        if led.value():
+            display.on()
+        else:
+            display.off()
+        time.sleep(0.25)
+    led.off()
+    alarms.acknowledge(now)
+    display.fill(st7789.BLACK)
+    display.off()
+    display.sleep_mode(True)
+    time.sleep(0.5)
  
 def date_set():
     display.fill(st7789.BLACK)
@@ -268,6 +375,8 @@ def date_set():
     while time.time()-tim < 50:
         if flag == 4:
             r.write_all(date=date_[0], month=date_[1], year=date_[2], day=date_[3])
+            clock.sync(adjusted=True)
+            alarms.arm(clock.datetime())  # The weekday may have changed.
             print_saved()
             break
         if flag == 3:
@@ -289,138 +398,125 @@ def print_saved():
     time.sleep(2)
     led.off()
  
+COMPASS_FRAME = const(25000)  # us, 40 needle updates per second.
+AZIMUTH = (' E ', ' NE ', ' N ', ' NW ', ' W ', ' SW ', ' S ', ' SE ')
+
+@power.screen(powerstate.ACCEL | powerstate.GYRO | powerstate.MAG)
 def compass():
-    from math import cos, sin, atan2
+    import ahrs
+    import needle
     
-    dfirst = 0
     CX = const(40)
     CY = const(80)
-    pi180 = 0.01745329252
-    angle_mem = 0
     
     display.fill(st7789.BLACK)
     display.rotation(2)
     display.fill_circle(CX, CY, 3, st7789.GREEN)
     display.fill_circle(CX, 36, 3, st7789.GREEN)
     display.fill_circle(CX, 124, 3, st7789.GREEN)
+    display.rotation(4)  # The needle and the upper label.
+    arrow = needle.Needle(display, 80, 160, CX, CY, color=st7789.RED)
+    arrow.draw(state.get('needle'))
+    # The gyro carries the needle between the 8 Hz magnetometer samples.
+    tracker = ahrs.HeadingTracker()
+    octant = -1
     
     tim = time.time()
+    frame = time.ticks_us()
     while time.time()-tim < 149: # The duration of the compass.
-        if time.time()-tim > 6:
-            if touchpad.value() == 1:
-                display.fill(st7789.BLACK)
-                horizontal_rotation()
-                return
-            
-        xm, ym, zm = sensor.magnetic
-        xa, ya, za = sensor.acceleration
-        pitch = atan2(ya, (xa*xa + za*za)**0.5)
-        roll = atan2(-xa, (ya*ya + za*za)**0.5)
-        x = xm*cos(pitch) + ym*sin(roll)*sin(pitch) - zm*cos(roll)*sin(pitch)
-        y = ym*cos(roll) + zm*sin(roll)
-        az = int(90 - atan2(y, x)*57.3)
-        
-        if az < 0:
-            az += 360
-        if az > 360:
-            az -= 360
-  
-        if dfirst > az:
-            if az < 90 and dfirst > 270:
-                c = 1
-            else:
-                c = -1
-        else:
-            if az > 270 and dfirst < 90:
-                c = -1
-            else:
-                c = 1
+        wait = COMPASS_FRAME - time.ticks_diff(time.ticks_us(), frame)
+        if wait > 0:
+            time.sleep_us(wait)
+        frame = time.ticks_us()
+        if time.time()-tim > 6 and touchpad.value() == 1:
+            break
             
-        if dfirst >= 361:
-            dfirst = 1
-        if dfirst <= -1:
-            dfirst = 359
-
-        angle = dfirst * pi180
-        display.rotation(4)
+        heading = tracker.feed(sensor, frame)
+        if heading is None:
+            continue
+        az = int(heading)
+        arrow.draw(az)
         
-        if c < 0:
-            display.line(int(CX + cos(angle) * 34),
-                         int(CY + sin(angle) * 34),
-                         int(CX - cos(angle_mem + 1.5) * 10),
-                         int(CY - sin(angle_mem + 1.5) * 10), st7789.RED)
-            display.line(int(CX + cos(angle_mem) * 35),
-                         int(CY + sin(angle_mem) * 35),
-                         int(CX + cos(angle_mem + 1.5) * 10),
-                         int(CY + sin(angle_mem + 1.5) * 10), st7789.BLACK)
-            display.line(int(CX + cos(angle_mem) * 36),
-                         int(CY + sin(angle_mem) * 36),
-                         int(CX + cos(angle_mem + 1.5) * 10),
-                         int(CY + sin(angle_mem + 1.5) * 10), st7789.BLACK)
-        else:
-            display.line(int(CX + cos(angle) * 34),
-                         int(CY + sin(angle) * 34),
-                         int(CX + cos(angle_mem + 1.5) * 10),
-                         int(CY + sin(angle_mem + 1.5) * 10), st7789.RED)
-            display.line(int(CX + cos(angle_mem) * 35),
-                         int(CY + sin(angle_mem) * 35),
-                         int(CX - cos(angle_mem + 1.5) * 10),
-                         int(CY - sin(angle_mem + 1.5) * 10), st7789.BLACK)
-            display.line(int(CX + cos(angle_mem) * 36),
-                         int(CY + sin(angle_mem) * 36),
-                         int(CX - cos(angle_mem + 1.5) * 10),
-                         int(CY - sin(angle_mem + 1.5) * 10), st7789.BLACK)
-        if az < 23:
-            azt = 'E'
-            azt2 = 'W'
-        elif az < 68:
-            azt = 'NE'
-            azt2 = 'SW'
-        elif az < 113:
-            azt = 'N'
-            azt2 = 'S'
-        elif az < 158:
-            azt = 'NW'
-            azt2 = 'SE'
-        elif az < 203:
-            azt = 'W'
-            azt2 = 'E'
-        elif az < 248:
-            azt = 'SW'
-            azt2 = 'NE'
-        elif az < 293:
-            azt = 'S'
-            azt2 = 'N'
-        elif az < 338:
-            azt = 'SE'
-            azt2 = 'NW'
-        elif az < 361:
-            azt = 'E'
-            azt2 = 'W'
-
-        display.text(vga2_bold_16x32, f' {azt2} ', 10, 0)
-        display.rotation(2)
-        display.text(vga2_bold_16x32, f' {azt} ', 10, 0)
-        angle_mem = angle
-        dfirst += c
+        # The labels only change every 45 degrees, and the rotation with them.
+        index = (az + 22) // 45 % 8
+        if index != octant:
+            octant = index
+            display.text(vga2_bold_16x32, AZIMUTH[(index + 4) % 8], 10, 0)
+            display.rotation(2)
+            display.text(vga2_bold_16x32, AZIMUTH[index], 10, 0)
+            display.rotation(4)
+    state.set('needle', arrow.heading)
     display.fill(st7789.BLACK)
+    horizontal_rotation()
 
+@power.screen(powerstate.ACCEL_LOW | powerstate.MAG_FAST)
 def calibrate():
+    import magcal
     display.fill(st7789.BLACK)
-    display.text(vga2_bold_16x32, 'Rotate   ', 10, 25, st7789.GREEN)
-    offset, scale = sensor.ak8963.calibrate(count=256, delay=200)
-    
-    with open('calib.py', 'w') as text:
-        text.write(f'offset = {offset}\nscale = {scale}')
+    display.text(vga2_bold_16x32, 'Rotate   ', 10, 10, st7789.GREEN)
+    display.rect(9, 55, 142, 10, st7789.WHITE)
+    calibrator = magcal.MagCalibrator(sensor.ak8963)
+    calibrator.start()
+    shown = 0
+    released = False  # The menu long press may still be held.
+    while calibrator.step():  # Takes samples at 100 Hz until it settles.
+        if touchpad.value() == 0:
+            released = True
+        elif released:
+            calibrator.cancel()
+            display.fill(st7789.BLACK)
+            return
+        width = int(calibrator.progress * 140)
+        if width != shown:
+            if width < shown:  # The solution moved, stability starts over.
+                display.fill_rect(10 + width, 56, shown - width, 8, st7789.BLACK)
+            color = st7789.GREEN if calibrator.quality > 0.5 else st7789.YELLOW
+            display.fill_rect(10, 56, width, 8, color)
+            shown = width
+        time.sleep_ms(5)
+
+    solution = calibrator.solution
+    if solution is None:
+        display.text(vga2_bold_16x32, 'Failed   ', 10, 10, st7789.RED)
+        time.sleep(2)
+        return
+    offset, matrix, radius = solution
+    display.fill_rect(0, 0, 160, 50, st7789.BLACK)  # The fit quality.
+    display.text(vga2_8x16, f'Field {radius:.1f} uT', 10, 10, st7789.GREEN)
+    display.text(vga2_8x16, f'Residual {calibrator.fit.residual * 100:.1f}%',
+                 10, 30, st7789.GREEN)
+    time.sleep(2)
+
+    cal = calstore.CalibrationStore()
+    cal.set(calstore.MAG_MATRIX, offset + matrix)
+    cal.set(calstore.ASA, sensor.ak8963.asa)
+    cal.save()
+    state.set('offset', offset)
+    state.set('scale', (1.0, 1.0, 1.0))
+    state.set('matrix', matrix)
+    print_saved()
+
+@power.screen(powerstate.ACCEL | powerstate.GYRO)
+def calibrate_imu():
+    display.fill(st7789.BLACK)
+    display.text(vga2_bold_16x32, 'Lay flat ', 10, 25, st7789.GREEN)
+    time.sleep(3)
+    gyro, accel = sensor.mpu6500.calibrate_offsets()
+
+    cal = calstore.CalibrationStore()
+    cal.set(calstore.GYRO_OFFSET, gyro)
+    cal.set(calstore.ACCEL_OFFSET, accel)
+    cal.save()
     print_saved()
 
 def wifipoints():
-    import boot
+    import network
+    sta_if = network.WLAN(network.STA_IF)
     display.fill(st7789.BLACK)
     display.text(vga2_bold_16x32, 'Scanning', 10, 25, st7789.GREEN)
-    boot.sta_if.active(True)
+    sta_if.active(True)
     scanlist = sta_if.scan()
-    boot.sta_if.active(False)
+    sta_if.active(False)
     display.fill(st7789.BLACK)
     point = 0
     tim = time.time()
@@ -435,21 +531,25 @@ def wifipoints():
     display.fill(st7789.BLACK)
     time.sleep(1)
     
+@power.screen(powerstate.OFF)  # Reads no sensor yet.
 def game():
     display.fill(st7789.BLACK)
     display.text(vga2_bold_16x32, 'WIP', 45, 25, st7789.GREEN)   
     time.sleep(4)
 
+@power.screen(powerstate.ACCEL_LOW)
 def menu():
     horizontal_rotation()
     display.fill(st7789.BLACK)
-    menutext = 'Exit     ', 'Time set ', 'Date set ', 'Compass  ', 'Calibrate', 'WiFi scan ', 'Game     '
-    foo = sleep, time_set, date_set, compass, calibrate, wifipoints, game
+    menutext = ('Exit     ', 'Time set ', 'Date set ', 'Alarm set', 'Alarm off',
+                'Compass  ', 'Calibrate', 'Level cal', 'WiFi scan ', 'Game     ')
+    foo = (sleep, time_set, date_set, alarm_set, alarm_clear, compass, calibrate,
+           calibrate_imu, wifipoints, game)
     
     point = 0
     tim = time.time()
     while time.time()-tim < 100:
-        step = steps(6, point)
+        step = steps(9, point)
         point = step[1]
         if step[0] == 1:
             foo[step[1]]()
@@ -480,44 +580,185 @@ def sleep(ghost=None):
         touch = 0
         calendar()
     else:
+        pace_stop()
         display.off()
-        # Sleep mode is not implemented in the driver, so we use brute force.  
-        i2c.writeto_mem(0x69, 0x6B, b'\x40')
+        power.apply(powerstate.OFF)
+        if WAKE_ON_MOTION:
+            sensor.mpu6500.enable_wake_on_motion(WAKE_ON_MOTION)
+            power.forget()
         display.sleep_mode(True)
-        esp32.wake_on_ext0(pin=touchpad, level=esp32.WAKEUP_ANY_HIGH)
-        led.off()
-        #print('...Zzz...')
-        esp32.gpio_deep_sleep_hold(True)
         time.sleep(0.5)
-        deepsleep()
+        deep_sleep()
+
+def deep_sleep():
+    # ext1 wakes on all pins low or on any pin high, so the active low
+    # PCF8563 line (timer and alarm) goes on ext0, the touchpad and the
+    # MPU9250 interrupt on ext1.
+    if arm_jobs() or r.check_for_alarm_interrupt():
+        esp32.wake_on_ext0(pin=rtc_int, level=esp32.WAKEUP_ALL_LOW)
+    else:
+        esp32.wake_on_ext0(pin=None, level=esp32.WAKEUP_ALL_LOW)
+    state.set('timer_repeat', r.timer_repeat)
+    state.save()
+    pins = (touchpad, imu_int) if WAKE_ON_MOTION else (touchpad,)
+    esp32.wake_on_ext1(pins=pins, level=esp32.WAKEUP_ANY_HIGH)
+    led.off()
+    #print('...Zzz...')
+    esp32.gpio_deep_sleep_hold(True)
+    deepsleep()
 
-spi = SPI(2, sck=Pin(18), mosi=Pin(19), miso=Pin(23), baudrate=20000000,
-          polarity=0, phase=0)
+JOB_INTERVAL = 0  # Minutes between background jobs [1,255], 0 - off.
+JOB_REPEAT = True  # False - the jobs run once after each use, not again.
+WAKE_ON_MOTION = 0  # Wrist raise threshold in mg [4,1020], 0 - off.
+job_left = 0
+pace_edge = False
 
-display = st7789.ST7789(spi, 80, 160, cs=Pin(5, Pin.OUT), dc=Pin(23, Pin.OUT),
-                        reset=Pin(26, Pin.OUT), backlight=Pin(27, Pin.OUT),
-                        color_order=st7789.BGR,
-                        rotation=0,
-                        options=0,
-                        buffer_size=0 )
+def arm_jobs():
+    if JOB_INTERVAL:
+        if not r.check_if_timer_on():
+            if not JOB_REPEAT and source in background:
+                return False  # The one-shot timer fired, a screen wake arms it.
+            r.set_timer(job_left or JOB_INTERVAL, pcf8563.TIMER_SOURCE_1_60HZ,
+                        repeat=JOB_REPEAT)
+        r.enable_timer_interrupt()
+        return True
 
-display.init()
+def run_jobs():  # Woken by the PCF8563 timer, the display stays off.
+    r.clear_timer()  # Stops a one-shot timer too.
+    for job in jobs:
+        job()
+    if r.timer_repeat:
+        r.set_timer(JOB_INTERVAL, pcf8563.TIMER_SOURCE_1_60HZ)
 
-i2c = I2C(1, scl=Pin(22), sda=Pin(21), freq=100000)
-i2c.writeto_mem(0x69, 0x6B, b'\x00')  # Waking up the gyroscope
+def log_battery():
+    with open('battery.log', 'a') as log:
+        log.write(f'{time.time()} {battery.read_uv() // 1000}\n')
+
+jobs = [log_battery]
 
+def wake_source():
+    # The PCF8563 flags tell the timer from the alarm, both keep the
+    # interrupt line low until cleared. The ESP32 does not tell which ext1
+    # pin fired, but the MPU9250 interrupt stays latched high.
+    if reset_cause() != DEEPSLEEP_RESET:
+        return 'boot'
+    reason = wake_reason()
+    if reason == EXT0_WAKE:
+        if r.check_if_alarm_on():
+            return 'alarm'
+        if r.check_for_timer_interrupt():
+            return 'timer'
+    if reason == EXT1_WAKE and imu_int.value() and not touchpad.value():
+        return 'motion'
+    return 'touch'
+
+# Wake sources served without the clock face, back to deep sleep afterwards.
+background = {'timer': run_jobs, 'alarm': ring}
+
+def init_display():
+    global display, vga2_8x16, vga2_bold_16x32
+    import vga2_8x16
+    import vga2_bold_16x32
+    spi = SPI(2, sck=Pin(18), mosi=Pin(19), miso=Pin(23), baudrate=20000000,
+              polarity=0, phase=0)
+
+    display = st7789.ST7789(spi, 80, 160, cs=Pin(5, Pin.OUT), dc=Pin(23, Pin.OUT),
+                            reset=Pin(26, Pin.OUT), backlight=Pin(27, Pin.OUT),
+                            color_order=st7789.BGR,
+                            rotation=state.get('rotation'),
+                            options=0,
+                            buffer_size=0 )
+
+    display.init()
+
+def init_sensors():
+    global sensor, mpu6500
+    import mpu6500
+    import mpu9250
+    from ak8963 import MODE_POWER_DOWN  # Screens turn it on, see power.
+    i2c.writeto_mem(0x69, 0x6B, b'\x00')  # Waking up the gyroscope
+
+    # After the first probe the chips, the AK8963 fuse ROM values and the
+    # calibration are taken from the RTC memory.
+    if state.get('probed'):
+        matrix = state.get('matrix')
+        imu = mpu6500.MPU6500(i2c, gyro_offset=state.get('gyro'),
+                              accel_offset=state.get('accel'), probe=False)
+        sensor = mpu9250.MPU9250(i2c, mpu6500=imu, offset=state.get('offset'),
+                                 scale=state.get('scale'),
+                                 matrix=matrix if any(matrix) else None,
+                                 asa=state.get('asa'), mode=MODE_POWER_DOWN,
+                                 probe=False)
+    else:
+        cal = calstore.CalibrationStore()
+        mag = cal.get(calstore.MAG_MATRIX)
+        matrix = None
+        scale = (1.0, 1.0, 1.0)
+        if mag is not None:
+            offset, matrix = mag[:3], mag[3:]
+        else:
+            mag = cal.get(calstore.MAG)
+            if mag is None:  # Not calibrated since calib.py was replaced.
+                from calib import offset, scale
+            else:
+                offset, scale = mag[:3], mag[3:]
+        gyro = cal.get(calstore.GYRO) or (0.0, 0.0, 0.0)
+        accel = cal.get(calstore.ACCEL) or (0.0, 0.0, 0.0)
+        imu = mpu6500.MPU6500(i2c, gyro_offset=gyro, accel_offset=accel)
+        sensor = mpu9250.MPU9250(i2c, mpu6500=imu, offset=offset, scale=scale,
+                                 matrix=matrix, asa=cal.get(calstore.ASA),
+                                 mode=MODE_POWER_DOWN)
+        # The MPU6500 keeps its offset registers until it loses power.
+        imu.set_offsets(cal.get(calstore.GYRO_OFFSET),
+                        cal.get(calstore.ACCEL_OFFSET))
+        state.set('gyro', gyro)
+        state.set('accel', accel)
+        state.set('probed', 1)
+        state.set('asa', sensor.ak8963.asa)
+        state.set('offset', offset)
+        state.set('scale', scale)
+        state.set('matrix', matrix or (0.0,) * 9)
+    sensor.mpu6500.disable_wake_on_motion()  # Releases a latched INT pin.
+    power.sensor = sensor
+
+# Kept in the RTC slow memory across deep sleep, defaults after power loss.
+state = rtcstore.RTCStore((
+    ('probed', 'B', 0),
+    ('asa', '3B', (128, 128, 128)),
+    ('offset', '3f', (0.0, 0.0, 0.0)),
+    ('scale', '3f', (1.0, 1.0, 1.0)),
+    ('matrix', '9f', (0.0,) * 9),  # All zero without a matrix calibration.
+    ('gyro', '3f', (0.0, 0.0, 0.0)),
+    ('accel', '3f', (0.0, 0.0, 0.0)),
+    ('rotation', 'B', 0),
+    ('needle', 'h', 0),
+    ('timer_repeat', 'B', 1),  # PCF8563.timer_repeat, see run_jobs().
+    ('first_pixel', 'H', 0),  # ms from the last wake to its first clock frame.
+))
+if reset_cause() != DEEPSLEEP_RESET:
+    state.reset()
+touch = 0  # Taps of this wake, counted from the first one.
+
+i2c = I2C(1, scl=Pin(22), sda=Pin(21), freq=100000)
 r = pcf8563.PCF8563(i2c)
+r.timer_repeat = bool(state.get('timer_repeat'))
+clock = wallclock.WallClock(r)  # Time is read from the PCF8563 once per wake.
+alarms = alarm.AlarmClock(r)
 
-dummy = mpu9250.MPU9250(i2c)
-ak8963 = ak8963.AK8963(i2c, offset=offset, scale=scale)
-sensor = mpu9250.MPU9250(i2c, ak8963=ak8963)
 battery = ADC(Pin(35, Pin.IN), atten=ADC.ATTN_11DB)
 touchpad = Pin(33, Pin.IN)
+rtc_int = Pin(34, Pin.IN)
+imu_int = Pin(38, Pin.IN)
 touchpower = Pin(25, Pin.OUT, value=1, hold=True)
 led = Pin(4, Pin.OUT)
-touch = 0
+
+source = wake_source()
+if source in background:
+    background[source]()
+    deep_sleep()
+
+init_display()
+init_sensors()
 touchpad.irq(trigger=Pin.IRQ_FALLING, handler=sleep)
 currentime()
 sleep()
-
-
@@ -33,9 +33,14 @@ from machine import I2C, Pin
 from micropython import const
 # pylint: enable=import-error
 
+_SMPLRT_DIV = const(0x19)
+_CONFIG = const(0x1a)
+_XG_OFFSET_H = const(0x13)
 _GYRO_CONFIG = const(0x1b)
 _ACCEL_CONFIG = const(0x1c)
 _ACCEL_CONFIG2 = const(0x1d)
+_LP_ACCEL_ODR = const(0x1e)
+_WOM_THR = const(0x1f)
 _ACCEL_XOUT_H = const(0x3b)
 _ACCEL_XOUT_L = const(0x3c)
 _ACCEL_YOUT_H = const(0x3d)
@@ -50,7 +55,34 @@ _GYRO_YOUT_H = const(0x45)
 _GYRO_YOUT_L = const(0x46)
 _GYRO_ZOUT_H = const(0x47)
 _GYRO_ZOUT_L = const(0x48)
+_FIFO_EN = const(0x23)
+_INT_PIN_CFG = const(0x37)
+_INT_ENABLE = const(0x38)
+_INT_STATUS = const(0x3a)
+_MOT_DETECT_CTRL = const(0x69)
+_USER_CTRL = const(0x6a)
+_PWR_MGMT_1 = const(0x6b)
+_PWR_MGMT_2 = const(0x6c)
+_FIFO_COUNTH = const(0x72)
+_FIFO_R_W = const(0x74)
 _WHO_AM_I = const(0x75)
+_XA_OFFSET_H = const(0x77)
+_YA_OFFSET_H = const(0x7a)
+_ZA_OFFSET_H = const(0x7d)
+
+_FIFO_SIZE = const(512)
+_FIFO_MODE_KEEP = const(0b01000000) # CONFIG, drop new samples when full
+_FIFO_TEMP = const(0b10000000)
+_FIFO_GYRO = const(0b01110000)
+_FIFO_ACCEL = const(0b00001000)
+_USER_FIFO_EN = const(0b01000000)
+_USER_FIFO_RST = const(0b00000100)
+_INT_FIFO_OFLOW = const(0b00010000)
+_INT_WOM = const(0b01000000)
+_INT_RAW_RDY = const(0b00000001)
+_INT_LATCH_EN = const(0b00100000)
+_INT_ANYRD_2CLEAR = const(0b00010000)
+_ACCEL_INTEL_EN = const(0b11000000) # enable, compare with previous sample
 
 #_ACCEL_FS_MASK = const(0b00011000)
 ACCEL_FS_SEL_2G = const(0b00000000)
@@ -77,24 +109,91 @@ _GYRO_SO_2000DPS = 16.4
 _TEMP_SO = 333.87
 _TEMP_OFFSET = 21
 
+_DLPF_CFG_MASK = const(0b00000111)
+_ACCEL_FCHOICE_B = const(0b00001000)
+_PWR_SLEEP = const(0b01000000)
+_PWR_CYCLE = const(0b00100000)
+
+# Gyro and temperature low pass filter bandwidth, 1kHz internal rate
+DLPF_BW_184HZ = const(1)
+DLPF_BW_92HZ = const(2)
+DLPF_BW_41HZ = const(3)
+DLPF_BW_20HZ = const(4)
+DLPF_BW_10HZ = const(5)
+DLPF_BW_5HZ = const(6)
+
+ACCEL_DLPF_BW_218HZ = const(1)
+ACCEL_DLPF_BW_99HZ = const(2)
+ACCEL_DLPF_BW_45HZ = const(3)
+ACCEL_DLPF_BW_21HZ = const(4)
+ACCEL_DLPF_BW_10HZ = const(5)
+ACCEL_DLPF_BW_5HZ = const(6)
+
+# Axes for set_standby(), or them together
+STANDBY_XA = const(0b00100000)
+STANDBY_YA = const(0b00010000)
+STANDBY_ZA = const(0b00001000)
+STANDBY_XG = const(0b00000100)
+STANDBY_YG = const(0b00000010)
+STANDBY_ZG = const(0b00000001)
+STANDBY_ACCEL = const(0b00111000)
+STANDBY_GYRO = const(0b00000111)
+
+# Wake up rate of the accelerometer in low power (cycle) mode
+LP_ACCEL_ODR_0_24HZ = const(0)
+LP_ACCEL_ODR_0_49HZ = const(1)
+LP_ACCEL_ODR_0_98HZ = const(2)
+LP_ACCEL_ODR_1_95HZ = const(3)
+LP_ACCEL_ODR_3_91HZ = const(4)
+LP_ACCEL_ODR_7_81HZ = const(5)
+LP_ACCEL_ODR_15_63HZ = const(6)
+LP_ACCEL_ODR_31_25HZ = const(7)
+LP_ACCEL_ODR_62_50HZ = const(8)
+LP_ACCEL_ODR_125HZ = const(9)
+LP_ACCEL_ODR_250HZ = const(10)
+LP_ACCEL_ODR_500HZ = const(11)
+
+# Presets for configure(): sample rate in Hz, gyro and accel DLPF, low
+# power accelerometer rate (None for full power). Currents from the
+# MPU-9250 datasheet.
+#
+# Gravity direction only, gyro off, accelerometer cycling at 15.63 Hz.
+# 8.4 uA at 0.98 Hz up to 19.8 uA at 31.25 Hz.
+PRESET_ORIENTATION = (None, None, None, LP_ACCEL_ODR_15_63HZ)
+# Accelerometer and gyro at 200 Hz, 41/45 Hz bandwidth. About 3.7 mA.
+PRESET_FUSION = (200, DLPF_BW_41HZ, ACCEL_DLPF_BW_45HZ, None)
+# Accelerometer and gyro at 500 Hz, 184/218 Hz bandwidth. About 3.7 mA.
+PRESET_GESTURE = (500, DLPF_BW_184HZ, ACCEL_DLPF_BW_218HZ, None)
+
 SF_G = 1
 SF_M_S2 = 9.80665 # 1 g = 9.80665 m/s2 ie. standard gravity
 SF_DEG_S = 1
 SF_RAD_S = 0.017453292519943 # 1 deg/s is 0.017453292519943 rad/s
 
+def _clamp_short(value):
+    return min(max(value, -32768), 32767)
+
+def _shorts_into(buf, values, count):
+    # Big endian signed shorts without ustruct, which allocates a tuple.
+    i = 0
+    while i < count:
+        value = buf[i * 2] << 8 | buf[i * 2 + 1]
+        values[i] = value - 0x10000 if value & 0x8000 else value
+        i += 1
+
 class MPU6500:
     """Class which provides interface to MPU6500 6-axis motion tracking device."""
     def __init__(
         self, i2c, address=0x69,
         accel_fs=ACCEL_FS_SEL_2G, gyro_fs=GYRO_FS_SEL_250DPS,
         accel_sf=SF_M_S2, gyro_sf=SF_RAD_S,
-        gyro_offset=(0, 0, 0)
+        gyro_offset=(0, 0, 0), accel_offset=(0, 0, 0), probe=True
     ):
         self.i2c = i2c
         self.address = address
 
         # 0x70 = standalone MPU6500, 0x71 = MPU6250 SIP
-        if self.whoami not in [0x71, 0x70]:
+        if probe and self.whoami not in [0x71, 0x70]:
             raise RuntimeError("MPU6500 not found in I2C bus.")
 
         self._accel_so = self._accel_fs(accel_fs)
@@ -102,6 +201,9 @@ class MPU6500:
         self._accel_sf = accel_sf
         self._gyro_sf = gyro_sf
         self._gyro_offset = gyro_offset
+        self._accel_offset = accel_offset
+        self._fifo_buf = None
+        self._fifo_frame = 0
 
     @property
     def acceleration(self):
@@ -113,9 +215,16 @@ class MPU6500:
         """
         so = self._accel_so
         sf = self._accel_sf
+        ox, oy, oz = self._accel_offset
 
         xyz = self._register_three_shorts(_ACCEL_XOUT_H)
-        return tuple([value / so * sf for value in xyz])
+        xyz = [value / so * sf for value in xyz]
+
+        xyz[0] -= ox
+        xyz[1] -= oy
+        xyz[2] -= oz
+
+        return tuple(xyz)
 
     @property
     def gyro(self):
@@ -143,6 +252,67 @@ class MPU6500:
         temp = self._register_short(_TEMP_OUT_H)
         return ((temp - _TEMP_OFFSET) / _TEMP_SO) + _TEMP_OFFSET
 
+    @property
+    def motion(self):
+        """
+        Acceleration, gyro and die temperature from a single 14 byte burst
+        read, so all three belong to the same sample. Returns a 3-tuple of
+        acceleration and gyro 3-tuples and temperature, in the same units
+        as the separate properties.
+        """
+        aso = self._accel_so
+        asf = self._accel_sf
+        gso = self._gyro_so
+        gsf = self._gyro_sf
+        aox, aoy, aoz = self._accel_offset
+        gox, goy, goz = self._gyro_offset
+
+        ax, ay, az, temp, gx, gy, gz = self._register_motion(_ACCEL_XOUT_H)
+        return (
+            (ax / aso * asf - aox, ay / aso * asf - aoy, az / aso * asf - aoz),
+            (gx / gso * gsf - gox, gy / gso * gsf - goy, gz / gso * gsf - goz),
+            ((temp - _TEMP_OFFSET) / _TEMP_SO) + _TEMP_OFFSET
+        )
+
+    def acceleration_into(self, xyz, buf=bytearray(6)):
+        """
+        Raw X, Y, Z acceleration into `xyz`, a caller owned array('h') or
+        similar. Nothing is allocated on the heap. Divide by 16384, 8192,
+        4096 or 2048 (2G to 16G full scale) for g.
+        """
+        self.i2c.readfrom_mem_into(self.address, _ACCEL_XOUT_H, buf)
+        _shorts_into(buf, xyz, 3)
+
+    def gyro_into(self, xyz, buf=bytearray(6)):
+        """
+        Raw X, Y, Z gyro into `xyz` without heap allocation. Divide by
+        131, 62.5, 32.8 or 16.4 (250 to 2000 DPS full scale) for deg/s.
+        """
+        self.i2c.readfrom_mem_into(self.address, _GYRO_XOUT_H, buf)
+        _shorts_into(buf, xyz, 3)
+
+    def motion_into(self, values, buf=bytearray(14)):
+        """
+        Raw accel X, Y, Z, temperature and gyro X, Y, Z from one burst read
+        into `values`, which holds at least 7 items. Nothing is allocated
+        on the heap.
+        """
+        self.i2c.readfrom_mem_into(self.address, _ACCEL_XOUT_H, buf)
+        _shorts_into(buf, values, 7)
+
+    @property
+    def fifo_count(self):
+        """ Number of bytes waiting in the FIFO. """
+        return self._register_short(_FIFO_COUNTH) & 0x1fff
+
+    @property
+    def fifo_overflow(self):
+        """
+        True if the FIFO filled up and samples were dropped since the last
+        check. Reading clears the flag.
+        """
+        return bool(self._register_char(_INT_STATUS) & _INT_FIFO_OFLOW)
+
     @property
     def whoami(self):
         """ Value of the whoami register. """
@@ -164,6 +334,238 @@ class MPU6500:
         self._gyro_offset = (ox / n, oy / n, oz / n)
         return self._gyro_offset
 
+    @property
+    def offsets(self):
+        """
+        Gyro and accelerometer offset registers as two 3-tuples of raw
+        register values, see `calibrate_offsets`.
+        """
+        gyro = self._register_three_shorts(_XG_OFFSET_H)
+        accel = (
+            self._register_short(_XA_OFFSET_H),
+            self._register_short(_YA_OFFSET_H),
+            self._register_short(_ZA_OFFSET_H)
+        )
+        return gyro, accel
+
+    def set_offsets(self, gyro=None, accel=None):
+        """ Write values returned by `calibrate_offsets` back. """
+        if gyro is not None:
+            buf = bytearray(6)
+            ustruct.pack_into(">hhh", buf, 0, *gyro)
+            self.i2c.writeto_mem(self.address, _XG_OFFSET_H, buf)
+        if accel is not None:
+            self._register_short(_XA_OFFSET_H, accel[0])
+            self._register_short(_YA_OFFSET_H, accel[1])
+            self._register_short(_ZA_OFFSET_H, accel[2])
+
+    def calibrate_offsets(self, count=256, delay=0):
+        """
+        Average `count` samples with the sensor at rest and write the bias
+        into the chip's own gyro and accelerometer offset registers, so
+        every reading (FIFO included) comes out corrected without any
+        per-read work. The axis closest to vertical keeps its 1g. Needs
+        both sensors running. Returns the new register values for
+        `set_offsets`, they are lost when the chip loses power.
+        """
+        self._gyro_offset = (0, 0, 0)
+        self._accel_offset = (0, 0, 0)
+        self.set_offsets(gyro=(0, 0, 0))
+        _, factory = self.offsets
+        utime.sleep_ms(100) # Let the zeroed gyro offsets reach the output
+
+        sums = [0, 0, 0, 0, 0, 0, 0]
+        values = [0, 0, 0, 0, 0, 0, 0]
+        n = count
+        while n:
+            utime.sleep_ms(delay)
+            self.motion_into(values)
+            for i in range(7):
+                sums[i] += values[i]
+            n -= 1
+
+        accel = [value / count for value in sums[0:3]]
+        gyro = [value / count for value in sums[4:7]]
+
+        # Remove gravity from the axis closest to vertical
+        up = 0
+        for i in range(3):
+            if abs(accel[i]) > abs(accel[up]):
+                up = i
+        accel[up] -= self._accel_so if accel[up] > 0 else -self._accel_so
+
+        # Gyro offsets count in 1000 DPS units, accelerometer offsets in
+        # 16G units shifted left by one, bit 0 is reserved.
+        gyro = tuple([_clamp_short(-round(value * _GYRO_SO_1000DPS / self._gyro_so))
+                      for value in gyro])
+        accel = tuple([_clamp_short(factory[i] - (round(accel[i] * _ACCEL_SO_16G
+                                                       / self._accel_so) & ~1))
+                       for i in range(3)])
+
+        self.set_offsets(gyro, accel)
+        return gyro, accel
+
+    def set_sample_rate(self, rate):
+        """
+        Output, FIFO and interrupt rate in Hz [4,1000]. Needs one of the
+        gyro DLPF settings, which run the sensors at 1kHz internally.
+        """
+        div = 1000 // rate - 1
+        self._register_char(_SMPLRT_DIV, min(max(div, 0), 255))
+
+    def set_dlpf(self, gyro_bw=DLPF_BW_41HZ, accel_bw=ACCEL_DLPF_BW_45HZ):
+        """ Gyro and accelerometer low pass filter bandwidth. """
+        config = self._register_char(_CONFIG) & ~_DLPF_CFG_MASK
+        self._register_char(_CONFIG, config | gyro_bw)
+        self._register_char(_ACCEL_CONFIG2, accel_bw)
+
+    def set_low_power_accel(self, odr=LP_ACCEL_ODR_15_63HZ):
+        """
+        Turn the gyro off and let the accelerometer wake up at `odr` only
+        to take a sample, sleeping in between.
+        """
+        self._register_char(_PWR_MGMT_1, 0)
+        self._register_char(_PWR_MGMT_2, STANDBY_GYRO)
+        self._register_char(_ACCEL_CONFIG2, _ACCEL_FCHOICE_B | ACCEL_DLPF_BW_218HZ)
+        self._register_char(_LP_ACCEL_ODR, odr)
+        self._register_char(_PWR_MGMT_1, _PWR_CYCLE)
+
+    def set_full_power(self):
+        """ Leave cycle mode and turn all axes of both sensors on. """
+        self._register_char(_PWR_MGMT_1, 0)
+        self._register_char(_PWR_MGMT_2, 0)
+
+    def set_standby(self, axes=0):
+        """
+        Put the `axes`, STANDBY_ constants or'ed together, in standby
+        while the chip is at full power, the other axes keep running and
+        0 turns them all on. A gyro axis needs about 35ms to start again.
+        """
+        self._register_char(_PWR_MGMT_2, axes)
+
+    def sleep(self):
+        """
+        Stop both sensors, only the serial interface and the registers
+        stay alive. Any of the set_ methods or `configure` wakes it.
+        """
+        self._register_char(_PWR_MGMT_1, _PWR_SLEEP)
+
+    def enable_wake_on_motion(self, threshold=100, odr=LP_ACCEL_ODR_15_63HZ):
+        """
+        Let the accelerometer alone watch for motion in cycle mode and
+        raise the INT pin once any axis changes by more than `threshold`
+        mg [4,1020] between samples. The pin stays high until
+        `motion_interrupt` is read.
+        """
+        self._register_char(_INT_ENABLE, _INT_WOM)
+        self._register_char(_MOT_DETECT_CTRL, _ACCEL_INTEL_EN)
+        self._register_char(_WOM_THR, min(max(threshold // 4, 1), 255))
+        config = self._register_char(_INT_PIN_CFG) & ~_INT_ANYRD_2CLEAR
+        self._register_char(_INT_PIN_CFG, config | _INT_LATCH_EN)
+        self._register_char(_INT_STATUS) # Release a stale interrupt
+        self.set_low_power_accel(odr)
+
+    def disable_wake_on_motion(self):
+        self._register_char(_INT_ENABLE, 0)
+        self._register_char(_MOT_DETECT_CTRL, 0)
+        config = self._register_char(_INT_PIN_CFG) & ~_INT_LATCH_EN
+        self._register_char(_INT_PIN_CFG, config)
+        self._register_char(_INT_STATUS)
+
+    def enable_data_ready_interrupt(self):
+        """
+        Raise the INT pin each time a new sample is in the data registers,
+        at the rate from `set_sample_rate`. The pin stays high until any
+        register is read, so a late handler still sees every edge.
+        """
+        self._register_char(_INT_ENABLE, _INT_RAW_RDY)
+        config = self._register_char(_INT_PIN_CFG)
+        self._register_char(_INT_PIN_CFG, config | _INT_LATCH_EN | _INT_ANYRD_2CLEAR)
+        self._register_char(_INT_STATUS) # Release a stale interrupt
+
+    def disable_data_ready_interrupt(self):
+        self._register_char(_INT_ENABLE, 0)
+        config = self._register_char(_INT_PIN_CFG)
+        config &= ~(_INT_LATCH_EN | _INT_ANYRD_2CLEAR)
+        self._register_char(_INT_PIN_CFG, config)
+        self._register_char(_INT_STATUS)
+
+    @property
+    def motion_interrupt(self):
+        """
+        True if wake on motion fired. Reading clears the latched INT pin.
+        """
+        return bool(self._register_char(_INT_STATUS) & _INT_WOM)
+
+    def configure(self, preset):
+        """ Apply one of the PRESET_ tuples. """
+        rate, gyro_bw, accel_bw, lp_odr = preset
+        if lp_odr is not None:
+            self.set_low_power_accel(lp_odr)
+        else:
+            self.set_full_power()
+            self.set_dlpf(gyro_bw, accel_bw)
+            self.set_sample_rate(rate)
+
+    def fifo_enable(self, accel=True, gyro=True, temp=False):
+        """
+        Reset the FIFO and start queueing the selected sensors at the
+        sample rate. Once full, new samples are dropped so the queued ones
+        stay aligned, `fifo_overflow` tells when that happened.
+        """
+        channels = 0
+        mask = 0
+        if accel:
+            channels += 3
+            mask |= _FIFO_ACCEL
+        if temp:
+            channels += 1
+            mask |= _FIFO_TEMP
+        if gyro:
+            channels += 3
+            mask |= _FIFO_GYRO
+        self._fifo_frame = channels * 2
+        if self._fifo_buf is None:
+            self._fifo_buf = memoryview(bytearray(_FIFO_SIZE))
+
+        self._register_char(_FIFO_EN, 0)
+        self._register_char(_USER_CTRL, _USER_FIFO_RST)
+        self._register_char(_CONFIG, self._register_char(_CONFIG) | _FIFO_MODE_KEEP)
+        self._register_char(_INT_STATUS) # Clear a stale overflow
+        self._register_char(_USER_CTRL, _USER_FIFO_EN)
+        self._register_char(_FIFO_EN, mask)
+
+    def fifo_disable(self):
+        self._register_char(_FIFO_EN, 0)
+        self._register_char(_USER_CTRL, _USER_FIFO_RST)
+
+    def read_fifo(self, columns):
+        """
+        Drain the queued samples with one burst read and decode them into
+        `columns`, one array('h') of raw values per channel in FIFO order:
+        accel X, Y, Z, temperature, gyro X, Y, Z, leaving out the channels
+        not enabled. Returns the number of samples decoded, which is
+        limited by the length of the arrays, 0 while the FIFO is not
+        enabled.
+        """
+        frame = self._fifo_frame
+        if not frame:
+            return 0
+        count = min(self.fifo_count // frame, len(columns[0]))
+        if not count:
+            return 0
+
+        buf = self._fifo_buf[:count * frame]
+        self.i2c.readfrom_mem_into(self.address, _FIFO_R_W, buf)
+
+        i = 0
+        for n in range(count):
+            for column in columns:
+                value = buf[i] << 8 | buf[i + 1]
+                column[n] = value - 0x10000 if value & 0x8000 else value
+                i += 2
+        return count
+
     def _register_short(self, register, value=None, buf=bytearray(2)):
         if value is None:
             self.i2c.readfrom_mem_into(self.address, register, buf)
@@ -176,6 +578,10 @@ class MPU6500:
         self.i2c.readfrom_mem_into(self.address, register, buf)
         return ustruct.unpack(">hhh", buf)
 
+    def _register_motion(self, register, buf=bytearray(14)):
+        self.i2c.readfrom_mem_into(self.address, register, buf)
+        return ustruct.unpack(">hhhhhhh", buf)
+
     def _register_char(self, register, value=None, buf=bytearray(1)):
         if value is None:
             self.i2c.readfrom_mem_into(self.address, register, buf)
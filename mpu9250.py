@@ -40,7 +40,12 @@ _I2C_BYPASS_DIS = const(0b00000000)
 
 class MPU9250:
     """Class which provides interface to MPU9250 9-axis motion tracking device."""
-    def __init__(self, i2c, mpu6500 = None, ak8963 = None):
+    def __init__(self, i2c, mpu6500 = None, ak8963 = None, **kwargs):
+        """
+        Extra keyword arguments are passed to the AK8963 constructor when
+        no ak8963 instance is given. It is only constructed after the I2C
+        bypass is enabled.
+        """
         if mpu6500 is None:
             self.mpu6500 = MPU6500(i2c)
         else:
@@ -53,7 +58,7 @@ class MPU9250:
         self.mpu6500._register_char(_INT_PIN_CFG, char)
 
         if ak8963 is None:
-            self.ak8963 = AK8963(i2c)
+            self.ak8963 = AK8963(i2c, **kwargs)
         else:
             self.ak8963 = ak8963
 
@@ -89,6 +94,25 @@ class MPU9250:
         """
         return self.ak8963.magnetic
 
+    @property
+    def motion(self):
+        """
+        Snapshot of all sensors: acceleration, gyro, temperature as read
+        together by `MPU6500.motion` followed by the magnetic 3-tuple.
+        """
+        return self.mpu6500.motion + (self.ak8963.magnetic,)
+
+    def read_into(self, acceleration, gyro, magnetic):
+        """
+        Raw readings of all three sensors into caller owned arrays without
+        heap allocation, see `MPU6500.acceleration_into`,
+        `MPU6500.gyro_into` and `AK8963.magnetic_into`. Returns False when
+        the magnetometer had no new sample and `magnetic` was left alone.
+        """
+        self.mpu6500.acceleration_into(acceleration)
+        self.mpu6500.gyro_into(gyro)
+        return self.ak8963.magnetic_into(magnetic)
+
     @property
     def whoami(self):
         return self.mpu6500.whoami
@@ -0,0 +1,113 @@
+'''
+needle.py - compass needle which only redraws the pixels that change.
+
+The needle is a narrow arrow head: two lines from the tip to two points
+either side of the pivot. Their end points are computed once for every
+whole degree, so a frame needs no trigonometry. The lines are walked with
+Bresenham into a list of pixel indices and compared with the previous
+needle through a byte per screen pixel: pixels in both are left alone,
+only the new ones are drawn and only the old ones are painted over with
+the background, each with a single display.pixel() call.
+
+    >>> n = needle.Needle(display, 80, 160, 40, 80)
+    >>> n.draw(heading)  # Returns the number of pixels written.
+'''
+from array import array
+from math import cos, sin
+from micropython import const
+
+_MAX = const(128)  # Pixels of one needle, two lines of at most 40 each.
+_TO_RAD = 0.01745329252
+
+
+class Needle:
+    def __init__(self, display, width, height, cx, cy, length=34, tail=10,
+                 spread=86, color=0xF800, background=0):
+        """width and height of the screen in the rotation the needle is
+        drawn in, (cx, cy) is the pivot, spread the angle in degrees
+        between the tip and each tail point.
+        """
+        self.display = display
+        self.color = color
+        self.background = background
+        self.heading = None
+        self._width = width
+        table = array('B', [0] * 360 * 6)
+        for d in range(360):
+            i = d * 6
+            a = d * _TO_RAD
+            table[i] = int(cx + cos(a) * length)
+            table[i + 1] = int(cy + sin(a) * length)
+            a = (d + spread) * _TO_RAD
+            table[i + 2] = int(cx + cos(a) * tail)
+            table[i + 3] = int(cy + sin(a) * tail)
+            a = (d - spread) * _TO_RAD
+            table[i + 4] = int(cx + cos(a) * tail)
+            table[i + 5] = int(cy + sin(a) * tail)
+        self._table = table
+        # 1 for pixels of the needle on screen, 2 while a frame keeps them
+        self._marks = bytearray(width * height)
+        self._pixels = array('H', [0] * _MAX)
+        self._next = array('H', [0] * _MAX)
+        self._count = 0
+
+    def _line(self, pixels, n, x0, y0, x1, y1):
+        # Bresenham, appends pixel indices from n on and returns the count
+        width = self._width
+        dx = abs(x1 - x0)
+        dy = -abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        error = dx + dy
+        while n < _MAX:
+            pixels[n] = y0 * width + x0
+            n += 1
+            if x0 == x1 and y0 == y1:
+                break
+            e2 = 2 * error
+            if e2 >= dy:
+                error += dy
+                x0 += sx
+            if e2 <= dx:
+                error += dx
+                y0 += sy
+        return n
+
+    def draw(self, heading):
+        """Move the needle to heading, degrees in screen orientation.
+        Returns the number of pixels written, 0 when it did not move.
+        """
+        d = int(heading) % 360
+        if d == self.heading:
+            return 0
+        table = self._table
+        i = d * 6
+        new = self._next
+        n = self._line(new, 0, table[i], table[i + 1], table[i + 2], table[i + 3])
+        n = self._line(new, n, table[i], table[i + 1], table[i + 4], table[i + 5])
+
+        marks = self._marks
+        width = self._width
+        pixel = self.display.pixel
+        writes = 0
+        # Draw the new pixels first, then erase the old ones, no flicker.
+        for k in range(n):
+            p = new[k]
+            if marks[p] == 0:
+                pixel(p % width, p // width, self.color)
+                writes += 1
+            marks[p] = 2
+        old = self._pixels
+        for k in range(self._count):
+            p = old[k]
+            if marks[p] == 1:
+                pixel(p % width, p // width, self.background)
+                marks[p] = 0
+                writes += 1
+        for k in range(n):
+            marks[new[k]] = 1
+
+        self._pixels, self._next = new, old
+        self._count = n
+        self.heading = d
+        return writes
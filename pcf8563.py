@@ -49,12 +49,14 @@ PCF8563_CENTURY_MASK = const(0x80)
 PCF8563_DAY_MASK = const(0x3F)
 PCF8563_MONTH_MASK = const(0x1F)
 PCF8563_TIMER_CTL_MASK = const(0x03)
+PCF8563_STOP = const(0x20)
 PCF8563_ALARM_AF = const(0x08)
 PCF8563_TIMER_TF = const(0x04)
 PCF8563_ALARM_AIE = const(0x02)
 PCF8563_TIMER_TIE = const(0x01)
 PCF8563_TIMER_TE = const(0x80)
 PCF8563_TIMER_TD10 = const(0x03)
+PCF8563_TIMER_TI_TP = const(0x10)
 PCF8563_NO_ALARM = const(0xFF)
 PCF8563_ALARM_ENABLE = const(0x80)
 PCF8563_CLK_ENABLE = const(0x80)
@@ -69,6 +71,11 @@ CLOCK_CLK_OUT_FREQ_32_KHZ = const(0x82)
 CLOCK_CLK_OUT_FREQ_1_HZ = const(0x83)
 CLOCK_CLK_HIGH_IMPEDANCE = const(0x0)
 
+TIMER_SOURCE_4096HZ = const(0x00)
+TIMER_SOURCE_64HZ = const(0x01)
+TIMER_SOURCE_1HZ = const(0x02)
+TIMER_SOURCE_1_60HZ = const(0x03)
+
 
 class PCF8563:
     def __init__(self, i2c, address=None):
@@ -78,6 +85,8 @@ class PCF8563:
         self.address = address if address else PCF8563_SLAVE_ADDRESS
         self.buffer = bytearray(16)
         self.bytebuf = memoryview(self.buffer[0:1])
+        self.timebuf = memoryview(self.buffer)[0:7]
+        self.timer_repeat = True
 
     def __write_byte(self, reg, val):
         self.bytebuf[0] = val
@@ -134,52 +143,63 @@ class PCF8563:
         """Return a tuple such as (year, month, date, day, hours, minutes,
         seconds).
         """
-        return (self.year(), self.month(), self.date(),
-                self.day(), self.hours(), self.minutes(),
-                self.seconds())
+        return self.snapshot()
+
+    def snapshot(self):
+        """Read the seconds..years registers in a single burst, so the
+        fields can not tear when the time rolls over between reads.
+        Return a tuple such as (year, month, date, day, hours, minutes,
+        seconds).
+        """
+        buf = self.timebuf
+        self.i2c.readfrom_mem_into(self.address, PCF8563_SEC_REG, buf)
+        bcd2dec = self.__bcd2dec
+        return (bcd2dec(buf[6]), bcd2dec(buf[5] & PCF8563_MONTH_MASK),
+                bcd2dec(buf[3] & PCF8563_DAY_MASK),
+                bcd2dec(buf[4] & PCF8563_WEEKDAY_MASK),
+                bcd2dec(buf[2] & PCF8563_HOUR_MASK),
+                bcd2dec(buf[1] & PCF8563_minuteS_MASK),
+                bcd2dec(buf[0] & 0x7F))
 
     def write_all(self, seconds=None, minutes=None, hours=None, day=None,
                   date=None, month=None, year=None):
         """Direct write un-none value.
         Range: seconds [0,59], minutes [0,59], hours [0,23],
                day [0,6], date [1-31], month [1-12], year [0-99].
+        All values are checked before anything is written, then the whole
+        seconds..years block is committed in one burst while the clock is
+        held by the STOP bit, so it can not run on between the fields.
         """
-        if seconds is not None:
-            if seconds < 0 or seconds > 59:
-                raise ValueError('Seconds is out of range [0,59].')
-            seconds_reg = self.__dec2bcd(seconds)
-            self.__write_byte(PCF8563_SEC_REG, seconds_reg)
-
-        if minutes is not None:
-            if minutes < 0 or minutes > 59:
-                raise ValueError('Minutes is out of range [0,59].')
-            self.__write_byte(PCF8563_MIN_REG, self.__dec2bcd(minutes))
-
-        if hours is not None:
-            if hours < 0 or hours > 23:
-                raise ValueError('Hours is out of range [0,23].')
-            # no 12 hour mode
-            self.__write_byte(PCF8563_HR_REG, self.__dec2bcd(hours))
-
-        if year is not None:
-            if year < 0 or year > 99:
-                raise ValueError('Years is out of range [0,99].')
-            self.__write_byte(PCF8563_YEAR_REG, self.__dec2bcd(year))
-
-        if month is not None:
-            if month < 1 or month > 12:
-                raise ValueError('Month is out of range [1,12].')
-            self.__write_byte(PCF8563_MONTH_REG, self.__dec2bcd(month))
-
-        if date is not None:
-            if date < 1 or date > 31:
-                raise ValueError('Date is out of range [1,31].')
-            self.__write_byte(PCF8563_DAY_REG, self.__dec2bcd(date))
-
-        if day is not None:
-            if day < 0 or day > 6:
-                raise ValueError('Day is out of range [0,6].')
-            self.__write_byte(PCF8563_WEEKDAY_REG, self.__dec2bcd(day))
+        if seconds is not None and (seconds < 0 or seconds > 59):
+            raise ValueError('Seconds is out of range [0,59].')
+        if minutes is not None and (minutes < 0 or minutes > 59):
+            raise ValueError('Minutes is out of range [0,59].')
+        # no 12 hour mode
+        if hours is not None and (hours < 0 or hours > 23):
+            raise ValueError('Hours is out of range [0,23].')
+        if year is not None and (year < 0 or year > 99):
+            raise ValueError('Years is out of range [0,99].')
+        if month is not None and (month < 1 or month > 12):
+            raise ValueError('Month is out of range [1,12].')
+        if date is not None and (date < 1 or date > 31):
+            raise ValueError('Date is out of range [1,31].')
+        if day is not None and (day < 0 or day > 6):
+            raise ValueError('Day is out of range [0,6].')
+
+        buf = self.timebuf
+        self.__write_byte(PCF8563_STAT1_REG, PCF8563_STOP)
+        try:
+            # Fields left as None keep their current (now frozen) value.
+            if None in (seconds, minutes, hours, date, day, month, year):
+                self.i2c.readfrom_mem_into(self.address, PCF8563_SEC_REG, buf)
+                buf[0] &= 0x7F  # drop the VL flag
+            for i, value in enumerate((seconds, minutes, hours, date, day,
+                                       month, year)):
+                if value is not None:
+                    buf[i] = self.__dec2bcd(value)
+            self.i2c.writeto_mem(self.address, PCF8563_SEC_REG, buf)
+        finally:
+            self.__write_byte(PCF8563_STAT1_REG, 0x00)
 
     def set_datetime(self, dt):
         """Input a tuple such as (year, month, date, day, hours, minutes,
@@ -281,3 +301,71 @@ class PCF8563:
                 raise ValueError('weekday is out of range [0,6].')
             self.__write_byte(PCF8563_ALARM_WEEKDAY, self.__dec2bcd(
                 weekday) & 0x7f)
+
+    def set_timer(self, value, source=TIMER_SOURCE_1HZ, repeat=True):
+        """Start the countdown timer, it fires every value [1,255] ticks
+        of the source clock until disable_timer(). The PCF8563 always
+        reloads it, with repeat=False clear_timer() stops it instead.
+        That choice is kept in `timer_repeat` only, which deep sleep loses:
+        save it with the rest of the state and set it again on wake.
+        """
+        if value < 1 or value > 255:
+            raise ValueError('Timer value is out of range [1,255].')
+        self.timer_repeat = repeat
+        buf = self.timebuf[0:2]
+        buf[0] = PCF8563_TIMER_TE | (source & PCF8563_TIMER_TD10)
+        buf[1] = value
+        self.i2c.writeto_mem(self.address, PCF8563_TIMER1_REG, buf)
+
+    def check_if_timer_on(self):
+        """Read the register to get the timer enabled
+        """
+        return bool(self.__read_byte(PCF8563_TIMER1_REG) & PCF8563_TIMER_TE)
+
+    def timer_remaining(self):
+        """Source clock ticks left until the timer fires
+        """
+        return self.__read_byte(PCF8563_TIMER2_REG)
+
+    def disable_timer(self):
+        """Stop the countdown timer, the 1/60 Hz source is selected
+        as the datasheet recommends for the lowest current.
+        """
+        self.__write_byte(PCF8563_TIMER1_REG, TIMER_SOURCE_1_60HZ)
+
+    def check_for_timer_interrupt(self):
+        """check for timer interrupt, is timer flag set return True
+        """
+        return bool(self.__read_byte(PCF8563_STAT2_REG) & PCF8563_TIMER_TF)
+
+    def clear_timer(self):
+        """Clear the timer flag, which releases the interrupt pin.
+        A one-shot timer is stopped as well, see set_timer().
+        """
+        timer_state = self.__read_byte(PCF8563_STAT2_REG)
+        timer_state &= ~PCF8563_TIMER_TF
+        timer_state |= PCF8563_ALARM_AF
+        self.__write_byte(PCF8563_STAT2_REG, timer_state)
+        if not self.timer_repeat:
+            self.disable_timer()
+
+    def enable_timer_interrupt(self, pulse=False):
+        """Turn on the timer interrupt output to the interrupt pin.
+        With pulse=True the pin pulses on every countdown instead of
+        staying low until the flag is cleared.
+        """
+        timer_state = self.__read_byte(PCF8563_STAT2_REG)
+        timer_state &= ~(PCF8563_TIMER_TF | PCF8563_TIMER_TI_TP)
+        timer_state |= PCF8563_ALARM_AF | PCF8563_TIMER_TIE
+        if pulse:
+            timer_state |= PCF8563_TIMER_TI_TP
+        self.__write_byte(PCF8563_STAT2_REG, timer_state)
+
+    def disable_timer_interrupt(self):
+        """Turn off the timer interrupt output to the interrupt pin
+        """
+        timer_state = self.__read_byte(PCF8563_STAT2_REG)
+        timer_state &= ~(PCF8563_TIMER_TF | PCF8563_TIMER_TIE |
+                         PCF8563_TIMER_TI_TP)
+        timer_state |= PCF8563_ALARM_AF
+        self.__write_byte(PCF8563_STAT2_REG, timer_state)
@@ -0,0 +1,100 @@
+'''
+powerstate.py - sensor power states for the T-Wristband screens.
+
+Each screen declares which sensors it reads, the manager picks the
+cheapest MPU6500 and AK8963 configuration that serves them on entry and
+puts the previous one back on exit:
+
+    @power.screen(powerstate.ACCEL_LOW | powerstate.MAG)
+    def compass():
+        ...
+
+MPU6500, cheapest first: sleep, accelerometer alone in cycle mode, full
+power with the axes of the unused sensor in standby (PWR_MGMT_2, see
+MPU6500.set_standby()). AK8963: power down, continuous 8Hz, continuous
+100Hz. Its single measurement mode is left out: the chip powers down
+after each sample and needs a CNTL1 write for the next one, so it only
+saves current below the 8Hz rate, which no screen reads the field at.
+Registers are only written when the configuration changes, so nested
+screens with the same needs cost no I2C traffic.
+'''
+from micropython import const
+
+OFF = const(0)
+ACCEL_LOW = const(1)  # Accelerometer alone, cycling at 15.63 Hz.
+ACCEL = const(2)  # Accelerometer at the full sample rate.
+GYRO = const(4)
+MAG = const(8)  # Magnetometer at 8 Hz.
+MAG_FAST = const(16)  # Magnetometer at 100 Hz.
+
+
+class PowerManager:
+    def __init__(self, sensor=None):
+        """sensor is an initialized mpu9250.MPU9250, it can also be set
+        later, before the first screen is entered.
+        """
+        self.sensor = sensor
+        self.needs = None
+        self._mpu = None
+        self._stack = []
+
+    def apply(self, needs):
+        """Configure both chips for needs, a mask of the constants above.
+        """
+        self.needs = needs
+        self._apply_mpu(needs & (ACCEL_LOW | ACCEL | GYRO))
+        self._apply_ak(needs & (MAG | MAG_FAST))
+
+    def _apply_mpu(self, needs):
+        if needs == self._mpu:
+            return
+        import mpu6500
+        imu = self.sensor.mpu6500
+        if needs & (ACCEL | GYRO):
+            imu.configure(mpu6500.PRESET_FUSION)
+            imu.set_standby((0 if needs & ACCEL else mpu6500.STANDBY_ACCEL)
+                            | (0 if needs & GYRO else mpu6500.STANDBY_GYRO))
+        elif needs:
+            imu.configure(mpu6500.PRESET_ORIENTATION)
+        else:
+            imu.sleep()
+        self._mpu = needs
+
+    def _apply_ak(self, needs):
+        import ak8963
+        if needs & MAG_FAST:
+            mode = ak8963.MODE_CONTINOUS_MEASURE_2
+        elif needs:
+            mode = ak8963.MODE_CONTINOUS_MEASURE_1
+        else:
+            mode = ak8963.MODE_POWER_DOWN
+        ak = self.sensor.ak8963
+        if ak.mode != mode:
+            ak.set_mode(mode)
+
+    def enter(self, needs):
+        self._stack.append(self.needs)
+        self.apply(needs)
+
+    def exit(self):
+        needs = self._stack.pop()
+        if needs is not None:
+            self.apply(needs)
+
+    def forget(self):
+        """Call when something else reconfigured the MPU6500, such as
+        MPU6500.enable_wake_on_motion(), the next apply() writes it again.
+        """
+        self._mpu = None
+
+    def screen(self, needs):
+        """Decorator for a screen function which runs with needs."""
+        def decorator(func):
+            def screen(*args, **kwargs):
+                self.enter(needs)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.exit()
+            return screen
+        return decorator
@@ -0,0 +1,75 @@
+'''
+rtcstore.py - typed key-value store in the ESP32 RTC slow memory.
+
+The RTC slow memory survives deep sleep but not a power loss, and reading
+or writing it costs no flash wear. Values are packed with ustruct into a
+fixed layout followed by a CRC32 of the layout and the data, so garbage
+left by a brownout or a store with a different layout is never read back:
+every field then falls back to its default.
+'''
+import ustruct
+from binascii import crc32
+from machine import RTC
+
+
+class RTCStore:
+    def __init__(self, fields):
+        """fields is a sequence of (name, format, default). format is a
+        ustruct code such as 'B', 'h' or '3f', a code with a count holds
+        a tuple.
+        """
+        self._fields = fields
+        self._fmt = '<' + ''.join([field[1] for field in fields])
+        self._size = ustruct.calcsize(self._fmt)
+        self._seed = crc32(self._fmt.encode())
+        self._buf = bytearray(self._size + 4)
+        self._rtc = RTC()
+        self._values = {}
+        self.load()
+
+    def load(self):
+        """Read the store back, return False if it fell back to defaults.
+        """
+        data = self._rtc.memory()
+        size = self._size
+        if (len(data) == size + 4 and ustruct.unpack_from('<I', data, size)[0]
+                == crc32(data[:size], self._seed)):
+            flat = ustruct.unpack_from(self._fmt, data)
+            i = 0
+            for name, fmt, default in self._fields:
+                if len(fmt) > 1:
+                    count = int(fmt[:-1])
+                    self._values[name] = flat[i:i + count]
+                    i += count
+                else:
+                    self._values[name] = flat[i]
+                    i += 1
+            return True
+        self.reset()
+        return False
+
+    def reset(self):
+        for name, fmt, default in self._fields:
+            self._values[name] = default
+
+    def get(self, name):
+        return self._values[name]
+
+    def set(self, name, value):
+        if name not in self._values:
+            raise KeyError(name)
+        self._values[name] = value
+
+    def save(self):
+        flat = []
+        for name, fmt, default in self._fields:
+            if len(fmt) > 1:
+                flat.extend(self._values[name])
+            else:
+                flat.append(self._values[name])
+        buf = self._buf
+        size = self._size
+        ustruct.pack_into(self._fmt, buf, 0, *flat)
+        ustruct.pack_into('<I', buf, size, crc32(memoryview(buf)[:size],
+                                                  self._seed))
+        self._rtc.memory(buf)
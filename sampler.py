@@ -0,0 +1,108 @@
+'''
+sampler.py - MPU6500 sampling paced by its data ready interrupt.
+
+Instead of polling the sensor properties whenever a screen likes, which
+returns the same sample twice or skips some, the MPU6500 raises its INT
+pin (pin 38 on the T-Wristband) for every new sample. The pin handler
+reads it with one burst into a preallocated ring buffer together with its
+ticks_us() timestamp, so each sample is read exactly once and nothing is
+allocated per sample.
+
+    >>> s = sampler.Sampler(sensor.mpu6500, imu_int)
+    >>> sensor.mpu6500.configure(mpu6500.PRESET_FUSION)
+    >>> s.start()
+    >>> values = array('h', range(7))
+    >>> s.latest(values)  # Newest sample, older pending ones are dropped.
+
+Samples are raw accel X, Y, Z, temperature and gyro X, Y, Z, the layout
+of MPU6500.motion_into(). When readers fall behind, new samples are
+dropped and counted in `overruns`, the queued ones are kept.
+'''
+from array import array
+from machine import Pin
+from utime import ticks_us
+
+_CHANNELS = 7
+
+
+class Sampler:
+    def __init__(self, imu, pin, size=32):
+        """imu is an initialized mpu6500.MPU6500, pin the machine.Pin its
+        INT output is wired to. The ring holds size - 1 samples.
+        """
+        self.imu = imu
+        self.pin = pin
+        self.overruns = 0
+        self._size = size
+        self._data = array('h', [0] * (size * _CHANNELS))
+        self._stamps = array('l', [0] * size)
+        data = memoryview(self._data)
+        self._slots = [data[i * _CHANNELS:(i + 1) * _CHANNELS]
+                       for i in range(size)]
+        self._head = 0
+        self._tail = 0
+        self._handler = self._read
+
+    def start(self):
+        """Empty the ring and start reading on every data ready edge. Set
+        the sample rate with MPU6500.configure() or set_sample_rate().
+        """
+        self._head = self._tail = 0
+        self.overruns = 0
+        self.pin.irq(handler=self._handler, trigger=Pin.IRQ_RISING)
+        self.imu.enable_data_ready_interrupt()
+
+    def stop(self):
+        self.pin.irq(handler=None)
+        self.imu.disable_data_ready_interrupt()
+
+    def _read(self, pin):
+        # Scheduled (soft) pin handler. Only the handler moves the head and
+        # only readers move the tail. The head slot is always free, so even
+        # a dropped sample is read and releases the latched INT pin.
+        head = self._head
+        self._stamps[head] = ticks_us()
+        self.imu.motion_into(self._slots[head])
+        head = (head + 1) % self._size
+        if head == self._tail:
+            self.overruns += 1
+        else:
+            self._head = head
+
+    @property
+    def pending(self):
+        """Number of samples not read yet."""
+        return (self._head - self._tail) % self._size
+
+    def latest(self, values):
+        """Copy the newest sample into values, at least 7 items, and drop
+        the older pending ones. Returns its ticks_us() timestamp, or None
+        and leaves values alone when no new sample came in.
+        """
+        head = self._head
+        if head == self._tail:
+            return None
+        last = (head - 1) % self._size
+        slot = self._slots[last]
+        for i in range(_CHANNELS):
+            values[i] = slot[i]
+        self._tail = head
+        return self._stamps[last]
+
+    def read(self, columns, stamps=None):
+        """Move the pending samples, oldest first, into columns: one
+        array('h') per channel in motion_into() order, trailing channels
+        may be left out. stamps receives the timestamps. Returns the number
+        of samples moved, limited by the length of the arrays.
+        """
+        tail = self._tail
+        count = min((self._head - tail) % self._size, len(columns[0]))
+        for n in range(count):
+            slot = self._slots[tail]
+            for i in range(len(columns)):
+                columns[i][n] = slot[i]
+            if stamps is not None:
+                stamps[n] = self._stamps[tail]
+            tail = (tail + 1) % self._size
+        self._tail = tail
+        return count
@@ -0,0 +1,51 @@
+'''
+wallclock.py - software wall clock for the T-Wristband.
+
+The PCF8563 is read once per wake to seed the ESP32 machine.RTC, after
+that the time is served from time.localtime() without any I2C traffic.
+The PCF8563 stays the reference: the ESP32 clock is resynced from it
+every `interval` seconds and the difference found at each resync is
+kept in `drift`.
+'''
+import time
+from machine import RTC
+
+
+class WallClock:
+    def __init__(self, pcf, interval=600):
+        """pcf is an initialized pcf8563.PCF8563, interval is the resync
+        period in seconds.
+        """
+        self.pcf = pcf
+        self.interval = interval
+        self.drift = 0
+        self._rtc = RTC()
+        self._synced = None
+
+    def sync(self, edge=False, adjusted=False):
+        """Read the PCF8563 and seed machine.RTC from it.
+        Pass edge=True right after a PCF8563 second boundary: the ESP32
+        clock is then seeded half a second into that second, so readers
+        woken by later boundaries never race its rollover.
+        Pass adjusted=True after the PCF8563 was set by hand, the jump is
+        then not taken for drift.
+        """
+        year, month, date, day, hours, minutes, seconds = self.pcf.snapshot()
+        year += 2000
+        if self._synced is not None and not adjusted:
+            now = time.mktime((year, month, date, hours, minutes, seconds,
+                               0, 0))
+            self.drift = time.time() - now
+        # machine.RTC counts weekdays from Monday, the PCF8563 from Sunday.
+        self._rtc.datetime((year, month, date, (day + 6) % 7, hours,
+                            minutes, seconds, 500000 if edge else 0))
+        self._synced = time.time()
+
+    def datetime(self):
+        """Return a tuple such as (year, month, date, day, hours, minutes,
+        seconds), the same layout as PCF8563.datetime().
+        """
+        if self._synced is None or time.time() - self._synced >= self.interval:
+            self.sync()
+        t = time.localtime()
+        return (t[0] % 100, t[1], t[2], (t[6] + 1) % 7, t[3], t[4], t[5])